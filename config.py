@@ -4,6 +4,8 @@ import os
 TARGET_W, TARGET_H = 1200, 627
 DEFAULT_INPUT_DIR = "./resources/input_images" 
 OUTPUT_DIR = "./resources/output_images"  
+COST_MODEL_PATH = "./resources/conv_cost_model.json"
+FFTW_WISDOM_PATH = "./resources/fftw_wisdom.json"
 EXTS = ("*.jpg","*.png", "*.JPG", "*.PNG")
 
 os.makedirs(DEFAULT_INPUT_DIR, exist_ok=True)
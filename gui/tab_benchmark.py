@@ -1,9 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
-import cv2
 import numpy as np
-import time
+import os
 import io 
 import threading 
 
@@ -11,6 +10,11 @@ import matplotlib.pyplot as plt
 
 import processing.hw2_ops_spatial_pil as spatial_ops
 import processing.hw3_ops_frequency as freq_ops
+import processing.conv_engine as conv_engine
+from processing.filter_bank import filter_cache_info
+import processing.fft_backends as fft_backends
+import processing.tracing as tracing
+from processing.image_buffer import ImageBuffer
 
 class TabBenchmark(ttk.Frame):
     def __init__(self, parent, main_app_ref=None):
@@ -101,6 +105,19 @@ class TabBenchmark(ttk.Frame):
         self.run_button = ttk.Button(settings_frame, text="2. Bắt đầu So sánh (4 Bộ lọc)",
                                      command=self.run_benchmark, state=tk.DISABLED)
         self.run_button.pack(fill=tk.X, pady=5)
+        self.calib_button = ttk.Button(settings_frame, text="Hiệu chỉnh mô hình chi phí (Conv/FFT)",
+                                       command=self.run_calibration)
+        self.calib_button.pack(fill=tk.X, pady=5)
+        self.fft_button = ttk.Button(settings_frame, text="So sánh FFT backend (miền tần số)",
+                                     command=self.run_fft_backend_comparison)
+        self.fft_button.pack(fill=tk.X, pady=5)
+
+        # --- Tracing: ghi span của mọi hàm xử lý trong cả phiên, xuất ra Chrome trace / CSV ---
+        self.trace_enabled = tk.BooleanVar(value=tracing.is_enabled())
+        ttk.Checkbutton(settings_frame, text="Ghi trace (toàn phiên)", variable=self.trace_enabled,
+                        command=self.toggle_tracing).pack(anchor="w", pady=(5, 0))
+        ttk.Button(settings_frame, text="Xuất trace (JSON + CSV)",
+                   command=self.export_trace).pack(fill=tk.X, pady=5)
         self.status_label = ttk.Label(settings_frame, text="", style="TLabel")
         self.status_label.pack(anchor="w", pady=10)
         
@@ -159,24 +176,12 @@ class TabBenchmark(ttk.Frame):
             return
         try:
             self.image_path = path
-            self.img_pil = Image.open(path).convert('RGB')
-            img_cv_bgr_raw = cv2.imread(path, cv2.IMREAD_UNCHANGED)
-            
-            if img_cv_bgr_raw is None:
-                raise ValueError("OpenCV không thể đọc file ảnh")
-
-            # CHUẨN HÓA ẢNH MÀU CHO LỌC TẦN SỐ (BẮT BUỘC 3 KÊNH BGR)
-            if img_cv_bgr_raw.ndim == 2:
-                # Nếu ảnh ban đầu là xám, ta chuyển nó thành BGR
-                self.img_bgr_cv = cv2.cvtColor(img_cv_bgr_raw, cv2.COLOR_GRAY2BGR)
-            elif img_cv_bgr_raw.ndim == 4:
-                # Nếu ảnh có alpha channel (4), chuyển BGRA -> BGR
-                self.img_bgr_cv = cv2.cvtColor(img_cv_bgr_raw, cv2.COLOR_BGRA2BGR)
-            else:
-                self.img_bgr_cv = img_cv_bgr_raw
-                
-            # Tạo ảnh Xám cho Lọc Không gian (nếu cần, hoặc giữ nguyên logic cũ)
-            self.img_gray_cv = cv2.cvtColor(self.img_bgr_cv, cv2.COLOR_BGR2GRAY)
+            # Giải mã MỘT lần (ảnh xám / có alpha đều được chuẩn hóa về 3 kênh BGR),
+            # các bố cục còn lại lấy từ cùng bộ đệm
+            img_buf = ImageBuffer.from_file(path)
+            self.img_pil = img_buf.to_pil()
+            self.img_bgr_cv = img_buf.to_cv()
+            self.img_gray_cv = img_buf.to_gray()
 
 
             # Xem trước
@@ -247,22 +252,23 @@ class TabBenchmark(ttk.Frame):
             results["F1_label"] = f1_name
             results["F2_label"] = f2_name
             
+            # Thống kê bộ đệm hàm truyền H trước khi quét (để tính riêng cho lần chạy này)
+            cache_before = filter_cache_info()
+
             for k in kernel_sizes:
                 self.after(0, self._update_status, f"Đang kiểm tra kernel {k}x{k}... (Chậm...)")
                 
                 # 1. ĐO LƯỜNG MIỀN KHÔNG GIAN (S1, S2)
                 
                 # S1
-                start_s1 = time.perf_counter()
-                s1_func(self.img_pil, k)
-                end_s1 = time.perf_counter()
-                s1_time = (end_s1 - start_s1) * 1000
+                with tracing.span('benchmark.S1', 'benchmark', filter=s1_name, k=k) as sp:
+                    s1_func(self.img_pil, k)
+                s1_time = sp.elapsed_ms
                 
                 # S2
-                start_s2 = time.perf_counter()
-                s2_func(self.img_pil, k)
-                end_s2 = time.perf_counter()
-                s2_time = (end_s2 - start_s2) * 1000
+                with tracing.span('benchmark.S2', 'benchmark', filter=s2_name, k=k) as sp:
+                    s2_func(self.img_pil, k)
+                s2_time = sp.elapsed_ms
                 
                 # 2. ĐO LƯỜNG MIỀN TẦN SỐ (F1, F2)
                 
@@ -270,24 +276,22 @@ class TabBenchmark(ttk.Frame):
                 n_butterworth = 2 # Giả định bậc n cố định cho BLPF/BHPF
                 
                 # F1
-                start_f1 = time.perf_counter()
-                # BLPF/BHPF cần bậc n
-                if f1_name in ["BLPF", "BHPF"]: 
-                    freq_ops.apply_frequency_filter(self.img_bgr_cv, f1_func, d0_equiv, n=n_butterworth)
-                else:
-                    freq_ops.apply_frequency_filter(self.img_bgr_cv, f1_func, d0_equiv)
-                end_f1 = time.perf_counter()
-                f1_time = (end_f1 - start_f1) * 1000
+                with tracing.span('benchmark.F1', 'benchmark', filter=f1_name, k=k) as sp:
+                    # BLPF/BHPF cần bậc n
+                    if f1_name in ["BLPF", "BHPF"]: 
+                        freq_ops.apply_frequency_filter(self.img_bgr_cv, f1_func, d0_equiv, n=n_butterworth)
+                    else:
+                        freq_ops.apply_frequency_filter(self.img_bgr_cv, f1_func, d0_equiv)
+                f1_time = sp.elapsed_ms
 
                 # F2
-                start_f2 = time.perf_counter()
-                # BLPF/BHPF cần bậc n
-                if f2_name in ["BLPF", "BHPF"]: 
-                    freq_ops.apply_frequency_filter(self.img_bgr_cv, f2_func, d0_equiv, n=n_butterworth)
-                else:
-                    freq_ops.apply_frequency_filter(self.img_bgr_cv, f2_func, d0_equiv)
-                end_f2 = time.perf_counter()
-                f2_time = (end_f2 - start_f2) * 1000
+                with tracing.span('benchmark.F2', 'benchmark', filter=f2_name, k=k) as sp:
+                    # BLPF/BHPF cần bậc n
+                    if f2_name in ["BLPF", "BHPF"]: 
+                        freq_ops.apply_frequency_filter(self.img_bgr_cv, f2_func, d0_equiv, n=n_butterworth)
+                    else:
+                        freq_ops.apply_frequency_filter(self.img_bgr_cv, f2_func, d0_equiv)
+                f2_time = sp.elapsed_ms
 
                 # --- Lưu kết quả vào dictionary chính ---
                 results["S1"].append(s1_time)
@@ -298,6 +302,10 @@ class TabBenchmark(ttk.Frame):
                 # === GỬI KẾT QUẢ TẠM THỜI VỀ LUỒNG GUI ===
                 self.after(0, self._update_benchmark_table, k, s1_time, s2_time, f1_time, f2_time)
             
+            cache_after = filter_cache_info()
+            results["filter_cache_hits"] = cache_after['hits'] - cache_before['hits']
+            results["filter_cache_misses"] = cache_after['misses'] - cache_before['misses']
+
             # === BÁO CÁO HOÀN THÀNH VỀ LUỒNG GUI ===
             self.after(0, self._on_benchmark_complete, results)
 
@@ -305,6 +313,105 @@ class TabBenchmark(ttk.Frame):
             # === BÁO LỖI VỀ LUỒNG GUI ===
             self.after(0, self._on_benchmark_error, e)
 
+    # === HIỆU CHỈNH MÔ HÌNH CHI PHÍ (conv_auto chọn Spatial/FFT) ===
+    def run_calibration(self):
+        self.calib_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Đang đo conv / FFT để hiệu chỉnh...")
+        thread = threading.Thread(target=self._calibration_worker_thread, daemon=True)
+        thread.start()
+
+    def _calibration_worker_thread(self):
+        """Chạy trong luồng nền; lưu hệ số ra đĩa rồi báo về luồng GUI"""
+        try:
+            model = conv_engine.calibrate_cost_model()
+            self.after(0, self._on_calibration_complete, model)
+        except Exception as e:
+            self.after(0, self._on_benchmark_error, e)
+            self.after(0, lambda: self.calib_button.config(state=tk.NORMAL))
+
+    # === SO SÁNH FFT BACKEND (OpenCV / numpy / scipy / pyFFTW) ===
+    def run_fft_backend_comparison(self):
+        if self.img_bgr_cv is None:
+            messagebox.showwarning("Thiếu ảnh", "Vui lòng chọn một ảnh để kiểm tra trước.")
+            return
+        self.fft_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Đang đo các FFT backend...")
+        thread = threading.Thread(target=self._fft_backend_worker_thread, daemon=True)
+        thread.start()
+
+    def _fft_backend_worker_thread(self, repeats=3):
+        """Đo apply_frequency_filter (GLPF) trên ảnh đã chọn với từng backend, lấy lần nhanh nhất"""
+        try:
+            results = {}
+            for name in fft_backends.available_backends():
+                freq_ops.apply_frequency_filter(self.img_bgr_cv, freq_ops.GLPF, 30, backend=name) # làm nóng
+                best = float('inf')
+                for _ in range(repeats):
+                    with tracing.span('benchmark.fft_backend', 'benchmark', backend=name) as sp:
+                        freq_ops.apply_frequency_filter(self.img_bgr_cv, freq_ops.GLPF, 30, backend=name)
+                    best = min(best, sp.elapsed_ms)
+                results[name] = best
+            self.after(0, self._on_fft_backend_complete, results)
+        except Exception as e:
+            self.after(0, self._on_benchmark_error, e)
+        finally:
+            self.after(0, lambda: self.fft_button.config(state=tk.NORMAL))
+
+    # === TRACING ===
+    def toggle_tracing(self):
+        if self.trace_enabled.get():
+            tracing.enable()
+            self.status_label.config(text="Đang ghi trace...")
+        else:
+            tracing.disable()
+            self.status_label.config(text=f"Đã dừng ghi trace ({len(tracing.get_events())} span).")
+
+    def export_trace(self):
+        if not tracing.get_events():
+            messagebox.showwarning("Trace trống", "Chưa có span nào. Bật 'Ghi trace' rồi chạy các thao tác trước.")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".json", initialfile="trace.json",
+                                            filetypes=[("Chrome trace", "*.json")])
+        if not path:
+            return
+        csv_path = os.path.splitext(path)[0] + ".csv"
+        try:
+            tracing.export_chrome_trace(path)
+            tracing.export_csv(csv_path)
+        except OSError as e:
+            messagebox.showerror("Lỗi", f"Không thể ghi trace: {e}")
+            return
+        top = "\n".join(f"  - {name}: {s['total_ms']:.1f} ms ({s['count']} lần)"
+                        for name, s in list(tracing.summary().items())[:8])
+        messagebox.showinfo(
+            "Trace",
+            f"Đã ghi:\n{path}\n{csv_path}\n(mở JSON bằng chrome://tracing hoặc ui.perfetto.dev)\n\n"
+            f"Tốn nhiều thời gian nhất:\n{top}"
+        )
+
+    def _on_fft_backend_complete(self, results):
+        self.status_label.config(text="Đã so sánh FFT backend.")
+        default = fft_backends.get_backend().name
+        h, w = self.img_bgr_cv.shape[:2]
+        lines = [f"  - {name}: {ms:.2f} ms" + ("  (mặc định)" if name == default else "")
+                 for name, ms in sorted(results.items(), key=lambda kv: kv[1])]
+        probe = ", ".join(f"{name} {ms:.2f} ms" for name, ms in fft_backends.probe_results.items())
+        messagebox.showinfo(
+            "FFT backend",
+            f"Lọc GLPF (D0=30) trên ảnh {w}x{h}:\n" + "\n".join(lines) +
+            f"\n\nDò lúc khởi động ({fft_backends.PROBE_SHAPE[0]}x{fft_backends.PROBE_SHAPE[1]}): {probe}"
+        )
+
+    def _on_calibration_complete(self, model):
+        self.calib_button.config(state=tk.NORMAL)
+        self.status_label.config(text="Đã lưu mô hình chi phí.")
+        messagebox.showinfo(
+            "Mô hình chi phí",
+            f"Conv: {model['direct_per_tap'] * 1e9:.2f} ns / (pixel x hệ số)\n"
+            f"FFT: {model['fft_per_nlogn'] * 1e9:.2f} ns / (N log2 N)\n\n"
+            f"Đã lưu tại: {conv_engine.COST_MODEL_PATH}"
+        )
+
     # === HÀM 3: CẬP NHẬT GIAO DIỆN (Chạy trên luồng GUI) ===
     def _update_status(self, message):
         """Hàm nhỏ để cập nhật thanh trạng thái"""
@@ -327,7 +434,10 @@ class TabBenchmark(ttk.Frame):
         # Vẽ biểu đồ
         self.draw_chart(results)
         
-        self.status_label.config(text="Hoàn tất!")
+        hits = results.get("filter_cache_hits", 0)
+        total = hits + results.get("filter_cache_misses", 0)
+        rate = hits / total * 100 if total else 0.0
+        self.status_label.config(text=f"Hoàn tất! (Bộ đệm H: {hits}/{total} lần dùng lại, {rate:.0f}%)")
         self.run_button.config(state=tk.NORMAL) # Bật lại nút bấm
 
     # === HÀM 5: BÁO LỖI (Chạy trên luồng GUI) ===
@@ -3,13 +3,18 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 import cv2
 import numpy as np
-import time 
 
 from processing.hw3_ops_frequency import (
-    apply_frequency_filter, IHPF, ILPF, BLPF, BHPF, GLPF, GHPF,
+    apply_frequency_filter, apply_filter_chain, IHPF, ILPF, BLPF, BHPF, GLPF, GHPF,
     process_hw3_1_sequential, 
-    process_hw3_2_iterative_ghpf
+    process_hw3_2_iterative_ghpf, SpectrumCache, make_preview_proxy
 )
+from processing.image_buffer import ImageBuffer
+from processing.buffer_arena import BufferArena, fit_preview
+from processing.tracing import span
+import processing.precision as precision
+
+FILTER_FUNCS = {"ILPF": ILPF, "IHPF": IHPF, "BLPF": BLPF, "BHPF": BHPF, "GLPF": GLPF, "GHPF": GHPF}
 
 class TabFrequency(ttk.Frame):
     def __init__(self, parent, main_app_ref=None):
@@ -21,6 +26,17 @@ class TabFrequency(ttk.Frame):
         self.img_processed_cv = None
         self.slider_timer = None
         self.history = []
+        # Bộ đệm dùng lại cho xem trước trực tiếp (giữ nguyên khi kích thước ảnh không đổi)
+        self.arena = BufferArena()
+        # Phổ thuận của ảnh đang xử lý: kéo slider D0/n chỉ còn nhân H + DFT ngược
+        self.spectrum_cache = SpectrumCache()
+        # Ảnh thu nhỏ vừa khung xem trước: (ảnh nguồn, kích thước khung, ảnh proxy)
+        self._proxy = None
+        # Chuỗi bộ lọc chờ áp dụng: các bộ (hàm H, D0, n) và nhãn hiển thị
+        self.filter_chain = []
+        self.filter_chain_names = []
+        # Độ chính xác / bộ nhớ làm việc đỉnh của lần lọc gần nhất
+        self.last_stats = {}
 
         # ===== LAYOUT  =====
         main_frame = ttk.Frame(self)
@@ -81,8 +97,20 @@ class TabFrequency(ttk.Frame):
                 variable=self.param_n, command=lambda e: self.delayed_apply(self.apply_filter_live),
                 state=tk.DISABLED)
         self.scale_n.pack(fill=tk.X)
+        self.use_float64 = tk.BooleanVar(value=precision.get_precision() == 'float64')
+        ttk.Checkbutton(scrollable, text="Tính phổ bằng float64 (chậm hơn, gấp đôi bộ nhớ)",
+                        variable=self.use_float64, command=self.on_precision_changed).pack(anchor="w")
         ttk.Button(scrollable, text="Áp dụng lọc", command=self.apply_filter_final).pack(fill=tk.X, pady=5)
         self.on_filter_selected()
+        ttk.Label(scrollable, text="🔗 Chuỗi bộ lọc (một lần DFT)", font=("Segoe UI", 10, "bold")).pack(anchor="w", pady=(8, 2))
+        ttk.Button(scrollable, text="Thêm bộ lọc hiện tại vào chuỗi", command=self.add_to_chain).pack(fill=tk.X, pady=3)
+        self.chain_label = ttk.Label(scrollable, text="Chuỗi: (trống)", wraplength=280)
+        self.chain_label.pack(anchor="w")
+        self.chain_faithful = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scrollable, text="Giữ lượng tử hoá trung gian (chậm, như lọc từng bước; cả HW3-1, HW3-2)",
+                        variable=self.chain_faithful).pack(anchor="w")
+        ttk.Button(scrollable, text="Áp dụng chuỗi", command=self.apply_chain_final).pack(fill=tk.X, pady=3)
+        ttk.Button(scrollable, text="Xoá chuỗi", command=self.clear_chain).pack(fill=tk.X, pady=3)
         ttk.Separator(scrollable).pack(fill=tk.X, pady=10)
         ttk.Label(scrollable, text="✅ Giải Bài Tập HW3", font=("Segoe UI", 11, "bold")).pack(anchor="w", pady=5)
         
@@ -95,8 +123,13 @@ class TabFrequency(ttk.Frame):
     # ======= Nhận ảnh từ MainApp =======
     def set_new_image(self, img_cv):
         """Hàm này được MainApp gọi để tải ảnh mới vào tab này"""
-        self.img_original_cv = img_cv.copy()
-        self.img_processed_cv = self.img_original_cv.copy() 
+        # Mảng BGR chỉ đọc dùng chung với các tab khác; các phép xử lý luôn tạo mảng mới
+        if isinstance(img_cv, ImageBuffer):
+            img_cv = img_cv.to_cv()
+        self.img_original_cv = img_cv
+        self.img_processed_cv = self.img_original_cv
+        self.arena.release()
+        self.spectrum_cache.invalidate()
         self.history.clear() 
         self.display_images()
 
@@ -116,10 +149,7 @@ class TabFrequency(ttk.Frame):
         path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp")])
         if not path: return
         try:
-            img_cv = cv2.imread(path)
-            if img_cv is None:
-                raise Exception(f"Không thể đọc file: {path}")
-            self.set_new_image(img_cv)
+            self.set_new_image(ImageBuffer.from_file(path))
         except Exception as e:
             messagebox.showerror("Lỗi mở ảnh", str(e))
 
@@ -166,19 +196,22 @@ class TabFrequency(ttk.Frame):
             messagebox.showinfo("Thông báo", "Không có thao tác để hoàn tác.")
             return
         self.img_processed_cv = self.history.pop()
+        self.spectrum_cache.invalidate()
         self.display_images()
 
     # === HÀM RESET_IMAGE  ===
     def reset_image(self):
         if not self.check_image_loaded(): return
         
-        self.img_processed_cv = self.img_original_cv.copy() # Reset về ảnh màu gốc
+        self.img_processed_cv = self.img_original_cv # Reset về ảnh màu gốc
         self.history.clear()
+        self.spectrum_cache.invalidate()
         self.display_images()
         
         self.param_d0.set(50)
         self.param_n.set(2)
         self.filter_choice.set("ILPF")
+        self.clear_chain()
         
         messagebox.showinfo("Đã khôi phục", "Đã khôi phục ảnh gốc và reset tất cả thanh trượt.")
 
@@ -191,6 +224,59 @@ class TabFrequency(ttk.Frame):
             self.label_n.config(state=tk.DISABLED)
             self.scale_n.config(state=tk.DISABLED)
 
+    # ===== CHUỖI BỘ LỌC =====
+    def _current_filter_spec(self):
+        """(hàm H, D0, n) theo lựa chọn hiện tại; n chỉ dùng cho Butterworth."""
+        mode = self.filter_choice.get()
+        n = self.param_n.get() if mode in ["BLPF", "BHPF"] else None
+        return FILTER_FUNCS[mode], self.param_d0.get(), n
+
+    def _update_chain_label(self):
+        text = " → ".join(self.filter_chain_names) if self.filter_chain_names else "(trống)"
+        self.chain_label.config(text=f"Chuỗi: {text}")
+
+    def add_to_chain(self):
+        spec = self._current_filter_spec()
+        name = f"{self.filter_choice.get()}(D0={spec[1]:g}" + (f", n={spec[2]:g})" if spec[2] is not None else ")")
+        self.filter_chain.append(spec)
+        self.filter_chain_names.append(name)
+        self._update_chain_label()
+
+    def clear_chain(self):
+        self.filter_chain.clear()
+        self.filter_chain_names.clear()
+        self._update_chain_label()
+
+    def apply_chain_final(self):
+        if not self.check_image_loaded(): return
+        if not self.filter_chain:
+            messagebox.showwarning("⚠️ Cảnh báo", "Chuỗi bộ lọc đang trống!")
+            return
+        faithful = self.chain_faithful.get()
+        try:
+            with span('frequency.chain', 'gui', filters=", ".join(self.filter_chain_names)) as sp:
+                result_cv, _ = apply_filter_chain(self.img_processed_cv, self.filter_chain,
+                                                  faithful=faithful, cache=self.spectrum_cache)
+            total_ms = sp.elapsed_ms
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Lỗi lọc chuỗi: {e}")
+            return
+        self.history.append(self.img_processed_cv)
+        self.img_processed_cv = result_cv
+        self.spectrum_cache.invalidate()
+        self.display_images()
+        how = "lọc từng bước" if faithful else "gộp H, một lần DFT"
+        messagebox.showinfo("Chuỗi bộ lọc",
+                            f"Đã áp dụng {len(self.filter_chain)} bộ lọc ({how}):\n"
+                            f"{' → '.join(self.filter_chain_names)}\n\n"
+                            f"Tổng thời gian: {total_ms:.2f} ms")
+
+    def on_precision_changed(self):
+        # Chính sách toàn cục: D, H, DFT, nhân H và DFT ngược của mọi lần lọc sau đều theo lựa chọn này
+        precision.set_precision('float64' if self.use_float64.get() else 'float32')
+        if self.img_original_cv is not None:
+            self.delayed_apply(self.apply_filter_live)
+
     # ===== HÀM XỬ LÝ =====
     
     def _run_filter_logic(self, img_base):
@@ -201,7 +287,7 @@ class TabFrequency(ttk.Frame):
         d0 = self.param_d0.get()
         n = self.param_n.get()
         
-        img_input = img_base.copy() 
+        img_input = img_base # Bộ lọc không sửa ảnh đầu vào nên không cần sao chép
         try:
             filter_func = None
             if mode == "ILPF": filter_func = ILPF
@@ -214,19 +300,40 @@ class TabFrequency(ttk.Frame):
                 return None, None
             
             if filter_func:
+                # Dùng lại phổ thuận đã tính khi xem trước (nếu cùng ảnh)
+                self.last_stats = {}
                 if mode in ["BLPF", "BHPF"]:
-                    return apply_frequency_filter(img_input, filter_func, d0, n)
+                    return apply_frequency_filter(img_input, filter_func, d0, n, cache=self.spectrum_cache,
+                                                  stats=self.last_stats)
                 else:
-                    return apply_frequency_filter(img_input, filter_func, d0)
+                    return apply_frequency_filter(img_input, filter_func, d0, cache=self.spectrum_cache,
+                                                  stats=self.last_stats)
             return None, None
         
         except Exception as e:
             messagebox.showerror("Lỗi", f"Lỗi lọc tần số: {e}")
             return None, None
 
+    def _canvas_size(self):
+        canvas_w = self.edited_canvas.winfo_width() - 10
+        canvas_h = self.edited_canvas.winfo_height() - 10
+        if canvas_w <= 1 or canvas_h <= 1:
+            canvas_w, canvas_h = 650, 650
+        return canvas_w, canvas_h
+
+    def _live_proxy(self):
+        """Ảnh đang xử lý thu nhỏ vừa khung (lưu lại tới khi ảnh hoặc kích thước khung đổi);
+        phổ của proxy được giữ trong spectrum_cache."""
+        size = self._canvas_size()
+        if self._proxy is None or self._proxy[0] is not self.img_processed_cv or self._proxy[1] != size:
+            self._proxy = (self.img_processed_cv, size, make_preview_proxy(self.img_processed_cv, *size))
+        return self._proxy[2]
+
     def apply_filter_live(self):
         if not self.check_image_loaded(): return
-        img_base_for_live = self.img_processed_cv 
+        # Xem trước trên proxy cỡ khung hiển thị (D0 theo chu kỳ / ảnh nên giữ nguyên);
+        # ảnh đầy đủ chỉ được lọc khi bấm "Áp dụng"
+        img_base_for_live = self._live_proxy()
         mode = self.filter_choice.get()
         d0 = self.param_d0.get()
         n = self.param_n.get()
@@ -242,11 +349,14 @@ class TabFrequency(ttk.Frame):
             else: return
 
             result_cv, _ = (None, None) # Khởi tạo
+            # Kết quả và các mảng tạm (phổ, YUV...) lấy từ arena, không cấp phát lại mỗi lần kéo slider
+            live_kw = {'out': self.arena.get('live', img_base_for_live.shape), 'scratch': self.arena,
+                       'cache': self.spectrum_cache}
             if filter_func:
                 if mode in ["BLPF", "BHPF"]:
-                    result_cv, _ = apply_frequency_filter(img_base_for_live, filter_func, d0, n)
+                    result_cv, _ = apply_frequency_filter(img_base_for_live, filter_func, d0, n, **live_kw)
                 else:
-                    result_cv, _ = apply_frequency_filter(img_base_for_live, filter_func, d0)
+                    result_cv, _ = apply_frequency_filter(img_base_for_live, filter_func, d0, **live_kw)
 
             if result_cv is not None:
                 self.display_live_preview(result_cv) # Hiển thị trên canvas 'edited'
@@ -254,39 +364,42 @@ class TabFrequency(ttk.Frame):
             print(f"Lỗi live preview: {e}")
             
     def apply_filter_final(self):        
-        self.history.append(self.img_processed_cv.copy())
+        self.history.append(self.img_processed_cv)
         
         result_cv, timings = self._run_filter_logic(self.img_processed_cv) 
         
         if result_cv is not None:
             self.img_processed_cv = result_cv
+            self.spectrum_cache.invalidate()
             self.display_images()
             
             if timings:
                 total_time = sum(timings.values())
                 # Sắp xếp lại timings để dễ đọc
-                time_order = ['A_Convert_YUV_ms', '1_Forward_DFT_ms', '2_FFT_Shift_ms', 
-                              '3_Multiply_Filter_H_ms', '4_IFFT_Shift_ms', '5_Inverse_DFT_ms', 'B_Merge_BGR_ms']
+                time_order = ['A_Convert_YUV_ms', '1_Forward_DFT_ms', '3_Multiply_Filter_H_ms',
+                              '5_Inverse_DFT_ms', 'B_Merge_BGR_ms']
                 details = "\n".join([f"  - {step}: {timings[step]:.2f} ms" for step in time_order if step in timings])
+                if 'A_Convert_YUV_ms' not in timings:
+                    details += "\n  (YUV + DFT thuận: lấy từ bộ đệm phổ)"
+                stats = self.last_stats
                 messagebox.showinfo(
                     "Đo thời gian (Miền Tần số - Ảnh màu)",
                     f"Thao tác: {self.filter_choice.get()}\n"
                     f"Tổng thời gian: {total_time:.2f} ms\n\n"
                     f"Chi tiết công đoạn:\n"
-                    f"{details}"
+                    f"{details}\n\n"
+                    f"Độ chính xác: {stats.get('precision', '?')}, "
+                    f"bộ nhớ làm việc đỉnh: {stats.get('peak_bytes', 0) / 2**20:.1f} MB"
                 )
 
     def display_live_preview(self, preview_img):
         try:
-            canvas_w = self.edited_canvas.winfo_width() - 10
-            canvas_h = self.edited_canvas.winfo_height() - 10
-            if canvas_w <= 1 or canvas_h <= 1:
-                canvas_w, canvas_h = 650, 650
+            canvas_w, canvas_h = self._canvas_size()
 
-            img_to_show = preview_img
+            # Thu nhỏ trước (vào bộ đệm của arena) rồi mới đổi màu / tạo ảnh PIL
+            img_to_show = fit_preview(preview_img, canvas_w, canvas_h, self.arena)
             img_rgb = cv2.cvtColor(img_to_show, cv2.COLOR_BGR2RGB)
             img_pil = Image.fromarray(img_rgb)
-            img_pil.thumbnail((canvas_w, canvas_h))
             
             img_tk = ImageTk.PhotoImage(img_pil)
             self.edited_canvas.configure(image=img_tk)
@@ -296,37 +409,46 @@ class TabFrequency(ttk.Frame):
 
     def run_hw3_1(self):
         if not self.check_image_loaded(): return
-        self.history.append(self.img_processed_cv.copy())
+        self.history.append(self.img_processed_cv)
         try:
-            result_cv, timings = process_hw3_1_sequential(self.img_original_cv, D0=25)
+            result_cv, timings = process_hw3_1_sequential(self.img_original_cv, D0=25,
+                                                          faithful=self.chain_faithful.get())
         except Exception as e:
             messagebox.showerror("Lỗi HW3-1", f"Lỗi trong quá trình xử lý: {e}")
             return
 
         if result_cv is not None:
             self.img_processed_cv = result_cv
+            self.spectrum_cache.invalidate()
             self.display_images()
             msg = (f"✅ Hoàn thành HW3-1 (GLPF -> GHPF) với D0=25.\n\n"
-                   f"Tổng thời gian xử lý: {timings['Total_time_ms']:.2f} ms\n"
-                   f"Thời gian GLPF: {timings['LP_Filter_Time_ms']:.2f} ms\n"
-                   f"Thời gian GHPF: {timings['HP_Filter_Time_ms']:.2f} ms")
+                   f"Tổng thời gian xử lý: {timings['Total_time_ms']:.2f} ms\n")
+            if 'LP_Filter_Time_ms' in timings:
+                msg += (f"Thời gian GLPF: {timings['LP_Filter_Time_ms']:.2f} ms\n"
+                        f"Thời gian GHPF: {timings['HP_Filter_Time_ms']:.2f} ms")
+            else:
+                msg += f"GLPF·GHPF gộp trong một lần DFT: {timings['Chain_Filter_Time_ms']:.2f} ms"
             messagebox.showinfo("Kết quả HW3-1", msg)
 
     def run_hw3_2(self):
         if not self.check_image_loaded(): return
-        self.history.append(self.img_processed_cv.copy())
+        self.history.append(self.img_processed_cv)
         try:
-            results_dict = process_hw3_2_iterative_ghpf(self.img_original_cv, D0=30)
+            results_dict = process_hw3_2_iterative_ghpf(self.img_original_cv, D0=30,
+                                                        faithful=self.chain_faithful.get())
         except Exception as e:
             messagebox.showerror("Lỗi HW3-2", f"Lỗi trong quá trình xử lý: {e}")
             return
         if results_dict:
             self.img_processed_cv = results_dict[100]['image']
+            self.spectrum_cache.invalidate()
             self.display_images()
             self.show_hw3_2_comparison(results_dict, self.img_original_cv)
             msg = "✅ Hoàn thành HW3-2 (GHPF lặp lại) với D0=30.\n\n"
+            msg += "(Chạy một lần tới 100 lượt, chụp kết quả tại từng mốc)\n"
             for passes, data in results_dict.items():
-                 msg += f"- {passes} passes: {data['time_ms']:.2f} ms\n"
+                 msg += (f"- {passes} passes: {data['time_ms']:.2f} ms"
+                         f" (+{data['segment_ms']:.2f} ms từ mốc trước)\n")
             messagebox.showinfo("Kết quả HW3-2", msg + "\n\n(Ảnh hiển thị là kết quả sau 100 lần lọc)")
             # File: tab_frequency.py (Thêm vào trong class TabFrequency)
 
@@ -1,9 +1,11 @@
 import os, threading, cv2, numpy as np
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from PIL import Image, ImageTk
 
 from processing.hw1_utils import list_images, read_bgr, save_jpg_png, center_crop_quarter, rotate_animation
+import processing.hw3_ops_frequency as freq_ops
+from processing.tracing import span
 from config import TARGET_W, TARGET_H, DEFAULT_INPUT_DIR, OUTPUT_DIR
 
 class TabGallery(ttk.Frame):
@@ -44,6 +46,7 @@ class TabGallery(ttk.Frame):
         ttk.Button(sidebar, text="Xoay", command=self.run_rotate).pack(fill=tk.X, pady=2)
         ttk.Button(sidebar, text="Crop", command=self.run_crop).pack(fill=tk.X, pady=2)
         ttk.Button(sidebar, text="Xuất JPG/PNG", command=self.run_export_all).pack(fill=tk.X, pady=2)
+        ttk.Button(sidebar, text="Lọc tần số cả thư mục", command=self.run_frequency_batch).pack(fill=tk.X, pady=2)
         ttk.Button(sidebar, text="AUTO DEMO", command=self.run_auto_demo).pack(fill=tk.X, pady=2)
 
         # Trung tâm: danh sách / icon
@@ -273,6 +276,32 @@ class TabGallery(ttk.Frame):
             messagebox.showinfo("Xuất ảnh", f"Thành công: {ok}, Lỗi: {fail}\nThư mục: {os.path.abspath(OUTPUT_DIR)}")
         self._run_in_thread(job)
 
+    def run_frequency_batch(self):
+        """Lọc tần số mọi ảnh trong thư mục theo lô (dùng chung H và bộ đệm), xuất JPG/PNG."""
+        filters = ["ILPF", "IHPF", "BLPF", "BHPF", "GLPF", "GHPF"]
+        name = simpledialog.askstring("Lọc tần số", f"Bộ lọc ({', '.join(filters)}):",
+                                      initialvalue="GLPF", parent=self)
+        if not name: return
+        name = name.strip().upper()
+        if name not in filters:
+            messagebox.showerror("Lỗi", f"Bộ lọc không hợp lệ: {name}")
+            return
+        d0 = simpledialog.askfloat("Lọc tần số", "Tần số cắt D0:", initialvalue=30, minvalue=1, parent=self)
+        if d0 is None: return
+        paths = list(self.image_paths)
+
+        def job():
+            with span('gallery.frequency_batch', 'gui', filter=name, D0=d0, images=len(paths)) as sp:
+                images = (read_bgr(p) for p in paths)
+                results = freq_ops.filter_images_batch(images, getattr(freq_ops, name), d0)
+                for p, img in zip(paths, results):
+                    base = os.path.splitext(os.path.basename(p))[0]
+                    save_jpg_png(f"{base}_{name}_D0_{d0:g}", img)
+            total_ms = sp.elapsed_ms
+            messagebox.showinfo("Lọc tần số", f"Đã lọc {len(paths)} ảnh ({name}, D0={d0:g}) trong {total_ms:.0f} ms\n"
+                                              f"Thư mục: {os.path.abspath(OUTPUT_DIR)}")
+        self._run_in_thread(job)
+
     def run_auto_demo(self):
         def job():
             cv2.startWindowThread()
@@ -5,6 +5,9 @@ from PIL import Image, ImageTk
 import cv2
 import numpy as np
 
+from processing.image_buffer import ImageBuffer
+from processing.buffer_arena import BufferArena, fit_preview, get_buffer
+
 POPUP_IMAGE_SIZE = 250 
 
 try:
@@ -32,6 +35,8 @@ class MorphologyTab(ttk.Frame):
         self.img_processed_cv = None
         self.history = []
         self.slider_timer = None 
+        # Bộ đệm dùng lại cho xem trước trực tiếp (giữ nguyên khi kích thước ảnh không đổi)
+        self.arena = BufferArena()
 
         # Biến điều khiển
         self.op_choice = tk.StringVar(value="Morphological: Erosion")
@@ -151,8 +156,12 @@ class MorphologyTab(ttk.Frame):
 
     # ======= HÀM NHẬN ẢNH TỪ MAINAPP =======
     def set_new_image(self, img_cv):
-        self.img_original_cv = img_cv.copy()
-        self.img_processed_cv = self.img_original_cv.copy() 
+        # Mảng BGR chỉ đọc dùng chung với các tab khác; các phép xử lý luôn tạo mảng mới
+        if isinstance(img_cv, ImageBuffer):
+            img_cv = img_cv.to_cv()
+        self.img_original_cv = img_cv
+        self.img_processed_cv = self.img_original_cv
+        self.arena.release()
         self.history.clear() 
         self.display_images()
 
@@ -172,14 +181,10 @@ class MorphologyTab(ttk.Frame):
         path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp")])
         if not path: return
         try:
-            img_cv = cv2.imread(path)
-            if img_cv is None:
-                raise Exception(f"Không thể đọc file: {path}")
-            
             if self.main_app and hasattr(self.main_app, 'load_image_to_editors'):
                 self.main_app.load_image_to_editors(path)
             else:
-                self.set_new_image(img_cv)
+                self.set_new_image(ImageBuffer.from_file(path))
         except Exception as e:
             messagebox.showerror("Lỗi mở ảnh", str(e))
 
@@ -203,7 +208,7 @@ class MorphologyTab(ttk.Frame):
     def reset_image(self):
         if not self.check_image_loaded(): return
         
-        self.img_processed_cv = self.img_original_cv.copy() 
+        self.img_processed_cv = self.img_original_cv 
         self.history.clear()
         self.display_images()
         
@@ -269,13 +274,14 @@ class MorphologyTab(ttk.Frame):
             if canvas_w <= 1 or canvas_h <= 1:
                 canvas_w, canvas_h = 650, 650
 
+            # Thu nhỏ trước (vào bộ đệm của arena) rồi mới đổi màu / tạo ảnh PIL
+            cv_img = fit_preview(cv_img, canvas_w, canvas_h, self.arena)
             if len(cv_img.shape) == 2 or cv_img.shape[2] == 1:
                 img_rgb = cv2.cvtColor(cv_img, cv2.COLOR_GRAY2BGR)
             else:
                  img_rgb = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
                  
             img_pil = Image.fromarray(img_rgb)
-            img_pil.thumbnail((canvas_w, canvas_h))
             
             img_tk = ImageTk.PhotoImage(img_pil)
             canvas.configure(image=img_tk)
@@ -332,7 +338,7 @@ class MorphologyTab(ttk.Frame):
 
     # ===== HÀM XỬ LÝ LOGIC =====
     
-    def _run_morphology_logic(self, img_base):
+    def _run_morphology_logic(self, img_base, live=False):
         if not self.check_image_loaded(): return None
         op = self.op_choice.get()
         params = {
@@ -342,10 +348,16 @@ class MorphologyTab(ttk.Frame):
             'iterations': self.iterations
         }
         
+        # Xem trước: ảnh xám, ảnh nhị phân, kết quả đều ghi vào bộ đệm dùng lại của arena
+        scratch = self.arena if live else None
         try:
-             results = execute_morphology(cv2.cvtColor(img_base, cv2.COLOR_BGR2GRAY), op, params)
+             img_gray = cv2.cvtColor(img_base, cv2.COLOR_BGR2GRAY,
+                                     dst=get_buffer(scratch, 'gray', img_base.shape[:2]))
+             out = self.arena.get('result', img_gray.shape) if live else None
+             results = execute_morphology(img_gray, op, params, out=out, scratch=scratch)
              if results and len(results) > 0:
-                 return cv2.cvtColor(results[-1][1], cv2.COLOR_GRAY2BGR)
+                 return cv2.cvtColor(results[-1][1], cv2.COLOR_GRAY2BGR,
+                                     dst=get_buffer(scratch, 'live', img_base.shape))
              return None
         except Exception as e:
             messagebox.showerror("Lỗi", f"Lỗi Morphology: {e}")
@@ -354,7 +366,7 @@ class MorphologyTab(ttk.Frame):
     def apply_filter_live(self):
         if self.op_choice.get() == "Morphological: Homework/Exercises":
              return
-        result_cv = self._run_morphology_logic(self.img_processed_cv) 
+        result_cv = self._run_morphology_logic(self.img_processed_cv, live=True) 
         if result_cv is not None:
              self.display_live_preview(result_cv)
 
@@ -363,7 +375,7 @@ class MorphologyTab(ttk.Frame):
              messagebox.showinfo("Thông báo", "Vui lòng sử dụng nút 'Chạy HW4-1 & HW4-2' cho bài tập này.")
              return
 
-        self.history.append(self.img_processed_cv.copy())
+        self.history.append(self.img_processed_cv)
         result_cv = self._run_morphology_logic(self.img_processed_cv)
         
         if result_cv is not None:
@@ -373,7 +385,7 @@ class MorphologyTab(ttk.Frame):
 
     def run_homework(self):
         if not self.check_image_loaded(): return
-        self.history.append(self.img_processed_cv.copy())
+        self.history.append(self.img_processed_cv)
         params = {
             'thres_hw': self.thres_hw,
             'se_size_hw': self.se_size_hw
@@ -388,7 +400,7 @@ class MorphologyTab(ttk.Frame):
 
         if results:
             self.display_homework_results_popup(results, cols=3)
-            self.img_processed_cv = self.img_original_cv.copy() 
+            self.img_processed_cv = self.img_original_cv 
             self.display_images()
             messagebox.showinfo("✅ Hoàn thành HW4", 
                                 "Đã chạy HW4-1 & HW4-2. Kết quả hiển thị trong cửa sổ Pop-up mới.")
\ No newline at end of file
@@ -3,14 +3,26 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 import cv2
 import numpy as np
-import time 
 
 from processing.hw2_ops_spatial_pil import (
-    negative_image, log_transform, gamma_transform, piecewise_linear, equalize_histogram,
-    mean_filter_basic, gaussian_filter_basic,
-    median_filter_basic, min_filter_basic, max_filter_basic, midpoint_filter_basic,
-    sobel_filter_basic, threshold_filter_basic
+    equalize_histogram, clahe_equalize,
+    threshold_filter_basic,
+    mean_filter_tiled, gaussian_filter_tiled,
+    median_filter_basic, min_filter_tiled, max_filter_tiled, midpoint_filter_tiled,
+    sobel_filter_tiled
 )
+from processing.point_ops import PointOpChain
+from processing.image_buffer import ImageBuffer
+from processing.buffer_arena import BufferArena, fit_preview
+from processing.tracing import span
+
+# Các biến đổi điểm theo từng kênh có thể gộp vào một LUT duy nhất
+FUSABLE_TRANSFORMS = {
+    "Negative": "negative",
+    "Log": "log",
+    "Gamma": "gamma",
+    "Piecewise Linear": "piecewise",
+}
 
 class TabSpatial(ttk.Frame):
     def __init__(self, parent, main_app_ref=None):
@@ -20,7 +32,13 @@ class TabSpatial(ttk.Frame):
         self.img_pil = None         
         self.img_edited_pil = None  
         self.history = []           
+        # Chuỗi biến đổi điểm đang gộp: img_edited_pil = point_chain(chain_base)
+        self.chain_base = None
+        self.point_chain = PointOpChain()
         self.slider_timer = None
+        # Bộ đệm dùng lại cho xem trước trực tiếp (giữ nguyên khi kích thước ảnh không đổi)
+        self.arena = BufferArena()
+        self._edited_cache = None   # (ảnh PIL, ImageBuffer tương ứng)
 
         # ===== LAYOUT =====
         main_frame = ttk.Frame(self)
@@ -68,7 +86,7 @@ class TabSpatial(ttk.Frame):
 
         ttk.Label(self.scrollable, text="⚙️ Biến đổi cường độ", font=("Segoe UI", 11, "bold")).pack(anchor="w", pady=5)
         self.transform_choice = tk.StringVar(value="Negative") # Đặt mặc định là Negative
-        transform_list = ["Negative", "Log", "Gamma", "Piecewise Linear", "Equalize Histogram", "Threshold"]
+        transform_list = ["Negative", "Log", "Gamma", "Piecewise Linear", "Equalize Histogram", "CLAHE", "Threshold"]
         
         ttk.Label(self.scrollable, text="Chọn kiểu biến đổi:").pack(anchor="w")
         transform_cb = ttk.Combobox(self.scrollable, textvariable=self.transform_choice,
@@ -107,6 +125,17 @@ class TabSpatial(ttk.Frame):
         ttk.Label(self.frame_threshold, text="Ngưỡng (Threshold 0-255):").pack(anchor="w")
         tk.Scale(self.frame_threshold, from_=0, to=255, resolution=1, length=280, orient="horizontal",
                 variable=self.param_thresh, command=lambda e: self.delayed_apply(self.apply_transform)).pack(fill=tk.X)
+
+        # === 4. FRAME CHO THAM SỐ CLAHE ===
+        self.frame_clahe = ttk.Frame(self.scrollable)
+        self.param_clip = tk.DoubleVar(value=2.0)
+        self.param_grid = tk.IntVar(value=8)
+        ttk.Label(self.frame_clahe, text="Giới hạn tương phản (clip limit):").pack(anchor="w")
+        tk.Scale(self.frame_clahe, from_=0.5, to=10, resolution=0.5, length=280, orient="horizontal",
+                variable=self.param_clip, command=lambda e: self.delayed_apply(self.apply_transform)).pack(fill=tk.X)
+        ttk.Label(self.frame_clahe, text="Số ô mỗi chiều (grid):").pack(anchor="w")
+        tk.Scale(self.frame_clahe, from_=2, to=16, resolution=1, length=280, orient="horizontal",
+                variable=self.param_grid, command=lambda e: self.delayed_apply(self.apply_transform)).pack(fill=tk.X)
         
         # Khởi tạo: Ẩn/hiện tham số lần đầu
         self.update_transform_controls()
@@ -144,6 +173,7 @@ class TabSpatial(ttk.Frame):
         self.frame_c_gamma.pack_forget()
         self.frame_low_high.pack_forget()
         self.frame_threshold.pack_forget()
+        self.frame_clahe.pack_forget()
 
         mode = self.transform_choice.get()
         
@@ -154,28 +184,53 @@ class TabSpatial(ttk.Frame):
             self.frame_low_high.pack(fill=tk.X)
         elif mode == "Threshold":
             self.frame_threshold.pack(fill=tk.X)
+        elif mode == "CLAHE":
+            self.frame_clahe.pack(fill=tk.X)
         # Negative và Equalize Histogram không cần tham số
 
 
     # ======= HÀM CHUYỂN ĐỔI CV2 <-> PIL =======
     def cv2_to_pil(self, img_cv):
-        """Chuyển ảnh CV2 (BGR) sang PIL (RGB)."""
-        img_rgb = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
-        return Image.fromarray(img_rgb)
+        """Chuyển ảnh CV2 (BGR) hoặc ImageBuffer sang PIL (RGB)."""
+        if not isinstance(img_cv, ImageBuffer):
+            img_cv = ImageBuffer(img_cv, 'BGR')
+        return img_cv.to_pil()
 
     def pil_to_cv2(self, img_pil):
         """Chuyển ảnh PIL (RGB) sang CV2 (BGR)."""
-        img_np = np.array(img_pil)
-        return cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+        return ImageBuffer.from_pil(img_pil).to_cv()
 
     # ======= HÀM LOGIC CHUNG =======
     def set_new_image(self, img_cv):
-        """Hàm này được MainApp gọi. Nhận ảnh CV2, chuyển sang PIL."""
+        """Hàm này được MainApp gọi. Nhận ImageBuffer (hoặc ảnh CV2), lấy ảnh PIL đã lưu đệm."""
         self.img_pil = self.cv2_to_pil(img_cv)
-        self.img_edited_pil = self.img_pil.copy()
+        self.img_edited_pil = self.img_pil
+        self.arena.release()
+        self._edited_cache = (self.img_pil, img_cv) if isinstance(img_cv, ImageBuffer) else None
         self.history.clear()
+        self._reset_chain()
         self.display_images()
 
+    def _reset_chain(self):
+        """Bắt đầu chuỗi biến đổi điểm mới từ ảnh đang chỉnh sửa."""
+        self.chain_base = np.array(self.img_edited_pil.convert('RGB'))
+        self.point_chain = PointOpChain()
+
+    def _edited_buffer(self):
+        """ImageBuffer của ảnh đang chỉnh sửa (tạo một lần cho mỗi trạng thái, dùng cho xem trước)."""
+        if self._edited_cache is None or self._edited_cache[0] is not self.img_edited_pil:
+            self._edited_cache = (self.img_edited_pil, ImageBuffer.from_pil(self.img_edited_pil))
+        return self._edited_cache[1]
+
+    def _live_out(self, gray=False):
+        """Mảng kết quả xem trước lấy từ arena (cùng kích thước ảnh; gray=True cho kết quả xám)."""
+        shape = self._edited_buffer().shape
+        return self.arena.get('live', shape[:2] if gray else shape)
+
+    def _push_history(self):
+        """Lưu trạng thái hiện tại (ảnh + chuỗi LUT) để hoàn tác từng bước."""
+        self.history.append((self.img_edited_pil.copy(), self.chain_base, self.point_chain))
+
     def delayed_apply(self, func):
         if self.slider_timer:
             self.after_cancel(self.slider_timer)
@@ -191,10 +246,7 @@ class TabSpatial(ttk.Frame):
         path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp")])
         if not path: return
         try:
-            img_cv = cv2.imread(path) 
-            if img_cv is None:
-                raise Exception(f"Không thể đọc file: {path}")
-            self.set_new_image(img_cv)
+            self.set_new_image(ImageBuffer.from_file(path))
         except Exception as e:
             messagebox.showerror("Lỗi mở ảnh", str(e))
 
@@ -235,25 +287,31 @@ class TabSpatial(ttk.Frame):
         if not self.history:
             messagebox.showinfo("Thông báo", "Không có thao tác để hoàn tác.")
             return
-        self.img_edited_pil = self.history.pop() 
+        self.img_edited_pil, self.chain_base, self.point_chain = self.history.pop()
         self.display_images()
 
     def reset_image(self):
         if not self.check_image_loaded(): return
         self.img_edited_pil = self.img_pil.copy() 
         self.history.clear()
+        self._reset_chain()
         self.display_images()
 
-    def display_live_preview(self, preview_pil_img):
-        """Hiển thị ảnh xem trước (PIL) trên canvas 'edited'"""
+    def display_live_preview(self, preview_img):
+        """Hiển thị ảnh xem trước (PIL, ImageBuffer hoặc mảng RGB/xám) trên canvas 'edited'"""
         try:
             canvas_w = self.edited_canvas.winfo_width() - 10
             canvas_h = self.edited_canvas.winfo_height() - 10
             if canvas_w <= 1 or canvas_h <= 1:
                 canvas_w, canvas_h = 650, 650
 
-            img_pil_copy = preview_pil_img.copy()
-            img_pil_copy.thumbnail((canvas_w, canvas_h))
+            if isinstance(preview_img, Image.Image):
+                img_pil_copy = preview_img.copy()
+                img_pil_copy.thumbnail((canvas_w, canvas_h))
+            else:
+                # Thu nhỏ vào bộ đệm của arena, chỉ tạo ảnh PIL ở kích thước khung hiển thị
+                arr = preview_img.data if isinstance(preview_img, ImageBuffer) else preview_img
+                img_pil_copy = Image.fromarray(fit_preview(arr, canvas_w, canvas_h, self.arena))
             
             img_tk = ImageTk.PhotoImage(img_pil_copy)
             self.edited_canvas.configure(image=img_tk)
@@ -266,41 +324,55 @@ class TabSpatial(ttk.Frame):
     def apply_transform(self, live=False):
         if not self.check_image_loaded(): return
         
+        mode = self.transform_choice.get()
+
         # 1. XÁC ĐỊNH ẢNH ĐẦU VÀO VÀ LƯU LỊCH SỬ
+        # Xem trước: chạy trên ImageBuffer, ghi kết quả vào bộ đệm dùng lại của arena
         if live:
-            # Ảnh đầu vào là ảnh đã chỉnh sửa hiện tại
-            img_input = self.img_edited_pil.copy() 
+            img_input = self._edited_buffer()
+            out_kw = {'out': self._live_out(gray=mode == "Threshold")}
         else:
-            # Áp dụng: Lưu lịch sử và dùng ảnh đã chỉnh sửa hiện tại làm đầu vào
-            self.history.append(self.img_edited_pil.copy()) 
-            img_input = self.img_edited_pil.copy() 
-
-        mode = self.transform_choice.get()
+            self._push_history()
+            img_input = self.img_edited_pil
+            out_kw = {}
         try:
-            start_time = time.perf_counter()
-            
-            # --- Áp dụng biến đổi ---
-            if mode == "Negative":
-                result = negative_image(img_input)
-            elif mode == "Log":
-                result = log_transform(img_input, self.param_c.get())
-            elif mode == "Gamma":
-                result = gamma_transform(img_input, self.param_c.get(), self.param_gamma.get())
-            elif mode == "Piecewise Linear":
-                result = piecewise_linear(img_input, self.param_low.get(), self.param_high.get())
-            elif mode == "Equalize Histogram":
-                result = equalize_histogram(img_input)
-            elif mode == "Threshold":
-                result = threshold_filter_basic(img_input, self.param_thresh.get())
-            else:
-                return
-            
-            total_time_ms = (time.perf_counter() - start_time) * 1000
+            with span('spatial.transform', 'gui', mode=mode, live=live) as sp:
+                # --- Biến đổi điểm: gộp vào chuỗi LUT, chỉ 1 lượt trên ảnh gốc của chuỗi ---
+                chain = None
+                if mode in FUSABLE_TRANSFORMS:
+                    if mode == "Log":
+                        params = (self.param_c.get(),)
+                    elif mode == "Gamma":
+                        params = (self.param_c.get(), self.param_gamma.get())
+                    elif mode == "Piecewise Linear":
+                        params = (self.param_low.get(), self.param_high.get())
+                    else:
+                        params = ()
+                    chain = self.point_chain.then(FUSABLE_TRANSFORMS[mode], *params)
+                    if live:
+                        result = chain.apply(self.chain_base, out=self.arena.get('live', self.chain_base.shape))
+                    else:
+                        result = Image.fromarray(chain.apply(self.chain_base), 'RGB')
+                # --- Các biến đổi còn lại (phụ thuộc toàn ảnh / đổi sang xám) ---
+                elif mode == "Equalize Histogram":
+                    result = equalize_histogram(img_input, **out_kw)
+                elif mode == "CLAHE":
+                    result = clahe_equalize(img_input, self.param_clip.get(), self.param_grid.get(), **out_kw)
+                elif mode == "Threshold":
+                    result = threshold_filter_basic(img_input, self.param_thresh.get(), **out_kw)
+                else:
+                    return
+
+            total_time_ms = sp.elapsed_ms
 
             if live:
                 self.display_live_preview(result)
             else:
                 self.img_edited_pil = result 
+                if chain is not None:
+                    self.point_chain = chain
+                else:
+                    self._reset_chain()
                 self.display_images()
                 messagebox.showinfo(
                     "Đo thời gian (Miền Không gian)",
@@ -314,46 +386,48 @@ class TabSpatial(ttk.Frame):
     def apply_filter(self, live=False):
         if not self.check_image_loaded(): return
         
-        # 1. XÁC ĐỊNH ẢNH ĐẦU VÀO VÀ LƯU LỊCH SỬ
-        if live:
-            # Ảnh đầu vào là ảnh đã chỉnh sửa hiện tại
-            img_input = self.img_edited_pil.copy()
-        else:
-            # Áp dụng: Lưu lịch sử và dùng ảnh đã chỉnh sửa hiện tại làm đầu vào
-            self.history.append(self.img_edited_pil.copy())
-            img_input = self.img_edited_pil.copy()
-
         mode = self.filter_choice.get()
         k = self.kernel_size.get()
         if k % 2 == 0: k += 1 
 
-        try:
-            start_time = time.perf_counter()
-            
-            # --- Áp dụng lọc ---
-            if mode == "Mean":
-                result = mean_filter_basic(img_input, k)
-            elif mode == "Gaussian":
-                result = gaussian_filter_basic(img_input, k)
-            elif mode == "Median":
-                result = median_filter_basic(img_input, k)
-            elif mode == "Min":
-                result = min_filter_basic(img_input, k)
-            elif mode == "Max":
-                result = max_filter_basic(img_input, k)
-            elif mode == "Midpoint":
-                result = midpoint_filter_basic(img_input, k)
-            elif mode == "Sobel":
-                result = sobel_filter_basic(img_input, k)
-            else:
-                return
+        # 1. XÁC ĐỊNH ẢNH ĐẦU VÀO VÀ LƯU LỊCH SỬ (các bộ lọc không sửa ảnh đầu vào nên không cần sao chép)
+        if live:
+            # Ảnh đầu vào là ảnh đã chỉnh sửa hiện tại; kết quả và mảng tạm lấy từ arena
+            img_input = self._edited_buffer()
+            kw = {'out': self._live_out(gray=mode == "Sobel"), 'scratch': self.arena}
+        else:
+            # Áp dụng: Lưu lịch sử và dùng ảnh đã chỉnh sửa hiện tại làm đầu vào
+            self._push_history()
+            img_input = self.img_edited_pil
+            kw = {}
 
-            total_time_ms = (time.perf_counter() - start_time) * 1000
+        try:
+            with span('spatial.filter', 'gui', mode=mode, k=k, live=live) as sp:
+                # --- Áp dụng lọc ---
+                if mode == "Mean":
+                    result = mean_filter_tiled(img_input, k, **kw)
+                elif mode == "Gaussian":
+                    result = gaussian_filter_tiled(img_input, k, **kw)
+                elif mode == "Median":
+                    result = median_filter_basic(img_input, k, **kw)
+                elif mode == "Min":
+                    result = min_filter_tiled(img_input, k, **kw)
+                elif mode == "Max":
+                    result = max_filter_tiled(img_input, k, **kw)
+                elif mode == "Midpoint":
+                    result = midpoint_filter_tiled(img_input, k, **kw)
+                elif mode == "Sobel":
+                    result = sobel_filter_tiled(img_input, k, **kw)
+                else:
+                    return
+
+            total_time_ms = sp.elapsed_ms
 
             if live:
                 self.display_live_preview(result)
             else:
                 self.img_edited_pil = result 
+                self._reset_chain()
                 self.display_images()
                 messagebox.showinfo(
                     "Đo thời gian (Miền Không gian)",
@@ -1,12 +1,12 @@
 import tkinter as tk
 from tkinter import ttk
-import cv2
 from tkinter import messagebox 
 from gui.tab_gallery import TabGallery
 from gui.tab_spatial import TabSpatial
 from gui.tab_frequency import TabFrequency
 from gui.tab_benchmark import TabBenchmark 
 from gui.tab_morphology import MorphologyTab 
+from processing.image_buffer import ImageBuffer
 
 class MainApp(tk.Tk):
 	def __init__(self):
@@ -57,19 +57,17 @@ class MainApp(tk.Tk):
 
 	def load_image_to_editors(self, image_path):
 		try:
-			# 1. Đọc ảnh bằng CV2 (định dạng chuẩn của app)
-			img_cv = cv2.imread(image_path)
-			if img_cv is None:
-				raise ValueError(f"Không thể đọc ảnh: {image_path}")
+			# 1. Giải mã ảnh MỘT lần vào bộ đệm chỉ đọc (BGR, định dạng chuẩn của app)
+			img_buf = ImageBuffer.from_file(image_path)
 
 			# 2. Gửi ảnh đến Tab 2 (Lọc Không gian)
-			self.tab2.set_new_image(img_cv)
+			self.tab2.set_new_image(img_buf)
 
 			# 3. Gửi ảnh đến Tab 3 (Lọc Tần số)
-			self.tab3.set_new_image(img_cv)
+			self.tab3.set_new_image(img_buf)
             
 			# 4. Gửi ảnh đến Tab 5 (Hình thái học - HW4)
-			self.tab5.set_new_image(img_cv)
+			self.tab5.set_new_image(img_buf)
 
 			# 5. Tự động chuyển qua Tab 2
 			self.notebook.select(self.tab2)
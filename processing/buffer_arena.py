@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import cv2
+
+# =========================================
+# 1. Vùng đệm dùng lại (arena)
+# =========================================
+class BufferArena:
+    """Các mảng tạm được đặt tên, dùng lại giữa các lần gọi (ví dụ mỗi lần kéo slider).
+    Mỗi tên giữ một khối byte liên tục chỉ lớn dần: get() trả về view đúng shape/dtype,
+    nên khi kích thước ảnh không đổi (hoặc nhỏ hơn) thì không cấp phát thêm.
+    Không an toàn đa luồng; các luồng con mượn arena riêng qua borrow()."""
+
+    def __init__(self):
+        self._blocks = {}
+        self._free = []
+        self._lock = threading.Lock()
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Mảng chưa khởi tạo có `shape`, `dtype`; nội dung cũ có thể còn lại."""
+        dtype = np.dtype(dtype)
+        shape = tuple(int(s) for s in shape)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        block = self._blocks.get(name)
+        if block is None or block.size < nbytes:
+            block = np.empty(max(nbytes, 1), dtype=np.uint8)
+            self._blocks[name] = block
+            self.allocations += 1
+        return block[:nbytes].view(dtype).reshape(shape)
+
+    @contextmanager
+    def borrow(self):
+        """Mượn một arena con (cho một luồng làm việc), trả lại khi xong để lần sau dùng lại."""
+        with self._lock:
+            child = self._free.pop() if self._free else BufferArena()
+        try:
+            yield child
+        finally:
+            with self._lock:
+                self._free.append(child)
+
+    @property
+    def nbytes(self):
+        return sum(b.size for b in self._blocks.values()) + sum(c.nbytes for c in self._free)
+
+    def release(self):
+        """Giải phóng toàn bộ (gọi khi đổi ảnh)."""
+        self._blocks.clear()
+        with self._lock:
+            self._free.clear()
+
+def get_buffer(scratch, name, shape, dtype=np.uint8):
+    """Lấy mảng tạm từ `scratch` (BufferArena) hoặc cấp phát mới nếu scratch là None."""
+    if scratch is None:
+        return np.empty(shape, dtype=dtype)
+    return scratch.get(name, shape, dtype)
+
+# =========================================
+# 2. Ảnh xem trước vừa khung hiển thị
+# =========================================
+def fit_preview(arr, max_w, max_h, scratch=None):
+    """Thu nhỏ mảng uint8 (giữ tỉ lệ, không phóng to, như PIL thumbnail) bằng INTER_AREA,
+    ghi vào bộ đệm 'preview' của scratch. Trả về chính `arr` nếu đã vừa khung."""
+    h, w = arr.shape[:2]
+    scale = min(max_w / w, max_h / h, 1.0)
+    if scale >= 1.0:
+        return arr
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    dst = get_buffer(scratch, 'preview', (size[1], size[0]) + arr.shape[2:], arr.dtype)
+    return cv2.resize(arr, size, dst=dst, interpolation=cv2.INTER_AREA)
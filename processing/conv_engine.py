@@ -0,0 +1,267 @@
+import json
+import os
+import time
+
+import numpy as np
+import cv2
+
+from config import COST_MODEL_PATH
+from processing.buffer_arena import get_buffer
+from processing.tracing import traced
+
+# =========================================
+# 1. Tích chập trực tiếp (Conv)
+# =========================================
+# Số phần tử tối đa của một khối hàng khi cộng dồn (giới hạn bộ nhớ tạm)
+CONV_CHUNK_ELEMS = 1 << 20
+
+def _conv_valid(A, k, out, scratch=None):
+    """Tương quan 'valid' bằng cách cộng dồn các lát dịch theo từng hệ số kernel.
+    Xử lý theo từng khối hàng để bộ nhớ tạm không vượt quá CONV_CHUNK_ELEMS.
+    A và out có thể có thêm trục kênh (HxWxC): mọi kênh được tính cùng lúc."""
+    kh, kw = k.shape
+    oh, ow = out.shape[:2]
+    row_elems = max(out[:1].size, 1)
+    rows = max(1, CONV_CHUNK_ELEMS // row_elems)
+    tmp = get_buffer(scratch, 'conv_tmp', (min(rows, oh),) + out.shape[1:], out.dtype)
+    for r0 in range(0, oh, rows):
+        r1 = min(oh, r0 + rows)
+        acc = out[r0:r1]
+        t = tmp[:r1 - r0]
+        for i in range(kh):
+            for j in range(kw):
+                if k[i, j] == 0:
+                    continue
+                np.multiply(A[r0 + i:r1 + i, j:j + ow], k[i, j], out=t)
+                acc += t
+    return out
+
+def _separable_factors(k, tol=1e-10):
+    """Tách kernel hạng 1 thành (cột, hàng) sao cho k = cột ⊗ hàng (kiểm tra bằng SVD).
+    Ngưỡng hạng được nới theo độ chính xác của dtype (float32). Trả về None nếu không tách được."""
+    kh, kw = k.shape
+    if kh == 1 or kw == 1:
+        return None
+    if np.issubdtype(k.dtype, np.floating):
+        tol = max(tol, np.finfo(k.dtype).eps * max(kh, kw) * 10)
+    u, s, vt = np.linalg.svd(k.astype(np.float64))
+    if s[0] == 0 or s[1] > tol * s[0]:
+        return None
+    scale = np.sqrt(s[0])
+    return u[:, 0] * scale, vt[0] * scale
+
+@traced()
+def conv(A, k, b=0):
+    kh, kw = k.shape
+    if b > 0:
+        h, w = A.shape
+        B = np.zeros((h + kh - 1, w + kw - 1)) 
+        th = int(kh / 2)
+        tw = int(kw / 2)
+        B[th:h + th, tw:w + tw] = A
+        A = B
+    
+    h, w = A.shape
+    C = np.zeros((h - kh + 1, w - kw + 1))
+    
+    # Kernel tách được (Gaussian, Mean): 2 lượt 1D, chi phí O(kh + kw) thay vì O(kh * kw)
+    factors = _separable_factors(k)
+    if factors is not None:
+        col, row = factors
+        T = np.zeros((h, w - kw + 1))
+        _conv_valid(A, row[np.newaxis, :], T)
+        return _conv_valid(T, col[:, np.newaxis], C)
+    return _conv_valid(A, k, C)
+
+@traced()
+def box_filter(A, n, out=None, scratch=None):
+    """Lọc trung bình n x n bằng ảnh tích phân (summed-area table).
+    Chi phí mỗi pixel không phụ thuộc n; biên đệm 0 giống conv(A, k, 1).
+    Nhận mảng HxW hoặc HxWxC (lọc tất cả kênh trong một lượt).
+    Kết quả float64 ghi vào `out` (nếu có); bảng tích phân lấy từ `scratch` (BufferArena)."""
+    h, w = A.shape[:2]
+    th = n // 2
+    dtype = np.int64 if np.issubdtype(A.dtype, np.integer) else np.float64
+    S = get_buffer(scratch, 'box_sat', (h + n, w + n) + A.shape[2:], dtype)
+    # Chỉ xóa phần đệm, phần giữa được ghi đè bằng ảnh
+    S[:th + 1] = 0
+    S[th + 1 + h:] = 0
+    S[:, :th + 1] = 0
+    S[:, th + 1 + w:] = 0
+    S[th + 1:th + 1 + h, th + 1:th + 1 + w] = A
+    np.cumsum(S, axis=0, out=S)
+    np.cumsum(S, axis=1, out=S)
+    total = get_buffer(scratch, 'box_total', A.shape, dtype)
+    np.subtract(S[n:, n:], S[:-n, n:], out=total)
+    total -= S[n:, :-n]
+    total += S[:-n, :-n]
+    if out is None:
+        out = np.empty(A.shape, dtype=np.float64)
+    return np.divide(total, n ** 2, out=out)
+
+@traced()
+def conv_multichannel(img, k, out=None, scratch=None):
+    """Tương quan ảnh uint8 HxW hoặc HxWxC với kernel k (đệm 0 như conv(A, k, 1)).
+    Tính trên float32, mọi kênh trong một lượt, theo từng khối hàng; kết quả được
+    làm tròn, bão hòa về [0, 255] và ghi vào `out` (uint8, cấp phát nếu None).
+    Các khối tạm lấy từ `scratch` (BufferArena) nếu có."""
+    k = np.asarray(k, dtype=np.float32)
+    kh, kw = k.shape
+    h, w = img.shape[:2]
+    th, tw = kh // 2, kw // 2
+    if out is None:
+        out = np.empty_like(img)
+    elif out.shape != img.shape or out.dtype != np.uint8:
+        raise ValueError("out phải là mảng uint8 cùng kích thước với ảnh")
+
+    factors = _separable_factors(k)
+    # Kernel lớn, không tách được: dùng FFT nếu mô hình chi phí cho là rẻ hơn
+    if factors is None:
+        t_direct, t_fft = estimate_conv_cost((h, w), k, 1)
+        if t_fft < t_direct:
+            channels = [(..., )] if img.ndim == 2 else [(..., c) for c in range(img.shape[2])]
+            for idx in channels:
+                out[idx] = np.clip(np.rint(fft_conv(img[idx], k, 1)), 0, 255)
+            return out
+
+    rows = max(1, min(h, CONV_CHUNK_ELEMS // max(img[:1].size, 1)))
+    chans = img.shape[2:]
+    src_buf = get_buffer(scratch, 'conv_src', (rows + kh - 1, w + kw - 1) + chans, np.float32)
+    acc_buf = get_buffer(scratch, 'conv_acc', (rows,) + img.shape[1:], np.float32)
+    if factors is not None:
+        T_buf = get_buffer(scratch, 'conv_rows', (rows + kh - 1,) + img.shape[1:], np.float32)
+    for r0 in range(0, h, rows):
+        r1 = min(h, r0 + rows)
+        # Khối nguồn float32 đã đệm 0 (hàng r0 - th .. r1 + kh - 2 - th của ảnh)
+        src = src_buf[:r1 - r0 + kh - 1]
+        src[:] = 0
+        s0, s1 = max(0, r0 - th), min(h, r1 + kh - 1 - th)
+        src[s0 - (r0 - th):s1 - (r0 - th), tw:tw + w] = img[s0:s1]
+        acc = acc_buf[:r1 - r0]
+        acc[:] = 0
+        if factors is not None:
+            col, row = factors
+            T = T_buf[:r1 - r0 + kh - 1]
+            T[:] = 0
+            _conv_valid(src, row[np.newaxis, :], T, scratch)
+            _conv_valid(T, col[:, np.newaxis], acc, scratch)
+        else:
+            _conv_valid(src, k, acc, scratch)
+        np.rint(acc, out=acc)
+        np.clip(acc, 0, 255, out=acc)
+        out[r0:r1] = acc
+    return out
+
+# =========================================
+# 2. Tích chập qua FFT (định lý tích chập)
+# =========================================
+@traced()
+def fft_conv(A, k, b=0):
+    """Cùng ngữ nghĩa với conv (tương quan, đệm 0 khi b > 0) nhưng tính bằng rfft2.
+    Kích thước FFT được đệm lên cv2.getOptimalDFTSize; phần 'valid' không bị quấn vòng."""
+    kh, kw = k.shape
+    A = np.asarray(A, dtype=np.float64)
+    if b > 0:
+        h, w = A.shape
+        th, tw = kh // 2, kw // 2
+        A = np.pad(A, ((th, kh - 1 - th), (tw, kw - 1 - tw)))
+    h, w = A.shape
+    fh, fw = cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w)
+    FA = np.fft.rfft2(A, s=(fh, fw))
+    FK = np.fft.rfft2(k, s=(fh, fw))
+    # Tương quan = nhân với liên hợp phổ của kernel
+    C = np.fft.irfft2(FA * np.conj(FK), s=(fh, fw))
+    return C[:h - kh + 1, :w - kw + 1]
+
+# =========================================
+# 3. Bộ chọn Spatial / FFT theo mô hình chi phí
+# =========================================
+# Hệ số mặc định (giây); ghi đè bằng calibrate_cost_model() và lưu ra COST_MODEL_PATH
+DEFAULT_COST_MODEL = {
+    "direct_per_tap": 4.0e-9,   # mỗi (pixel x hệ số kernel) của conv
+    "fft_per_nlogn": 4.5e-9,    # mỗi N*log2(N) của một cặp rfft2/irfft2
+}
+_cost_model = None
+
+def load_cost_model(path=COST_MODEL_PATH):
+    """Đọc hệ số từ đĩa (nếu có), ngược lại dùng giá trị mặc định."""
+    global _cost_model
+    model = dict(DEFAULT_COST_MODEL)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                model.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    _cost_model = model
+    return model
+
+def get_cost_model():
+    if _cost_model is None:
+        load_cost_model()
+    return _cost_model
+
+def _direct_taps(k):
+    kh, kw = k.shape
+    if _separable_factors(k) is not None:
+        return kh + kw
+    return int(np.count_nonzero(k))
+
+def estimate_conv_cost(shape, k, b=0, model=None):
+    """Ước lượng thời gian (giây) của (conv, fft_conv) cho ảnh kích thước `shape`."""
+    model = model or get_cost_model()
+    kh, kw = k.shape
+    h, w = shape
+    if b > 0:
+        h, w = h + kh - 1, w + kw - 1
+    out_px = max(h - kh + 1, 0) * max(w - kw + 1, 0)
+    t_direct = model["direct_per_tap"] * out_px * _direct_taps(k)
+    N = cv2.getOptimalDFTSize(h) * cv2.getOptimalDFTSize(w)
+    t_fft = model["fft_per_nlogn"] * N * np.log2(max(N, 2))
+    return t_direct, t_fft
+
+@traced()
+def conv_auto(A, k, b=0):
+    """Chọn conv hoặc fft_conv theo chi phí ước lượng; kết quả như conv(A, k, b)."""
+    t_direct, t_fft = estimate_conv_cost(A.shape, k, b)
+    if t_fft < t_direct:
+        return fft_conv(A, k, b)
+    return conv(A, k, b)
+
+def _best_time(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+@traced()
+def calibrate_cost_model(sizes=(256, 512, 1024), ksizes=(3, 5, 9), path=COST_MODEL_PATH):
+    """Đo conv/fft_conv trên máy hiện tại, khớp bình phương tối thiểu qua gốc
+    cho từng hệ số rồi lưu ra `path`. Trả về dict hệ số mới."""
+    rng = np.random.default_rng(0)
+    xs_d, ts_d, xs_f, ts_f = [], [], [], []
+    for size in sizes:
+        A = rng.random((size, size))
+        for n in ksizes:
+            # Kernel ngẫu nhiên (không tách được) để đo đúng chi phí mỗi hệ số
+            k = rng.random((n, n))
+            ts_d.append(_best_time(lambda: conv(A, k, 1)))
+            xs_d.append(size * size * _direct_taps(k))
+            # Kích thước DFT theo đúng kernel vừa đo (ảnh đệm thêm n - 1)
+            N = cv2.getOptimalDFTSize(size + n - 1) ** 2
+            ts_f.append(_best_time(lambda: fft_conv(A, k, 1)))
+            xs_f.append(N * np.log2(N))
+
+    xs_d, ts_d = np.array(xs_d, dtype=np.float64), np.array(ts_d)
+    xs_f, ts_f = np.array(xs_f, dtype=np.float64), np.array(ts_f)
+    model = {
+        "direct_per_tap": float(np.dot(xs_d, ts_d) / np.dot(xs_d, xs_d)),
+        "fft_per_nlogn": float(np.dot(xs_f, ts_f) / np.dot(xs_f, xs_f)),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=2)
+    load_cost_model(path)
+    return model
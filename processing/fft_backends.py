@@ -0,0 +1,219 @@
+import base64
+import json
+import os
+import threading
+
+import numpy as np
+import cv2
+
+from config import FFTW_WISDOM_PATH
+from processing.precision import complex_dtype
+from processing.tracing import span, traced
+
+# Thư viện tuỳ chọn: thiếu thì backend tương ứng không được đăng ký
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
+# Số luồng cho các backend hỗ trợ đa luồng (scipy workers=, pyFFTW threads=)
+FFT_WORKERS = os.cpu_count() or 1
+
+# Kích thước / số lần đo khi dò backend nhanh nhất lúc khởi động
+PROBE_SHAPE = (512, 512)
+PROBE_REPEATS = 3
+
+# numpy >= 2.0 nhận out= trong np.fft (ghi thẳng vào bộ đệm của arena)
+_NUMPY_FFT_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+# =========================================
+# 1. Các backend DFT thực 2D
+# =========================================
+# Mỗi backend có: name, layout (bố cục phổ, xem filter_bank.get_transfer_function),
+# spectrum_spec(shape, dtype) -> (shape phổ, dtype phổ), forward(y, out) -> phổ,
+# inverse(phổ, shape, out) -> mảng thực (tỉ lệ tuỳ backend; kết quả luôn được chuẩn hoá min-max).
+# dtype là độ chính xác thực float32 / float64 (processing/precision.py): phổ, DFT ngược
+# giữ nguyên độ chính xác của đầu vào.
+class OpenCVBackend:
+    """cv2.dft / cv2.idft, phổ nén CCS thực cùng kích thước và dtype với ảnh (một luồng)."""
+    name = 'opencv'
+    layout = 'ccs'
+
+    def spectrum_spec(self, shape, dtype=np.float32):
+        return tuple(shape), np.dtype(dtype)
+
+    def forward(self, y32, out=None):
+        return cv2.dft(y32, dst=out)
+
+    def inverse(self, spectrum, shape, out=None):
+        return cv2.idft(spectrum, dst=out, flags=cv2.DFT_REAL_OUTPUT)
+
+class NumpyBackend:
+    """np.fft.rfft2 / irfft2 (pocketfft, một luồng), phổ phức nửa mặt phẳng."""
+    name = 'numpy'
+    layout = 'half'
+
+    def spectrum_spec(self, shape, dtype=np.float32):
+        return (shape[0], shape[1] // 2 + 1), complex_dtype(dtype)
+
+    def forward(self, y32, out=None):
+        if _NUMPY_FFT_OUT and out is not None:
+            return np.fft.rfft2(y32, out=out)
+        return np.fft.rfft2(y32)
+
+    def inverse(self, spectrum, shape, out=None):
+        if _NUMPY_FFT_OUT and out is not None:
+            return np.fft.irfft2(spectrum, s=shape, out=out)
+        return np.fft.irfft2(spectrum, s=shape)
+
+class ScipyBackend:
+    """scipy.fft.rfft2 / irfft2 chạy song song trên `workers` luồng."""
+    name = 'scipy'
+    layout = 'half'
+
+    def __init__(self, workers=None):
+        self.workers = workers or FFT_WORKERS
+
+    def spectrum_spec(self, shape, dtype=np.float32):
+        return (shape[0], shape[1] // 2 + 1), complex_dtype(dtype)
+
+    def forward(self, y32, out=None):
+        res = scipy_fft.rfft2(y32, workers=self.workers)
+        if out is None:
+            return res
+        np.copyto(out, res)
+        return out
+
+    def inverse(self, spectrum, shape, out=None):
+        res = scipy_fft.irfft2(spectrum, s=shape, workers=self.workers)
+        if out is None:
+            return res
+        np.copyto(out, res)
+        return out
+
+class PyFFTWBackend:
+    """FFTW qua pyFFTW: mỗi (chiều, kích thước) lập kế hoạch một lần (FFTW_MEASURE) rồi dùng lại;
+    wisdom được lưu ra đĩa nên lần chạy sau lập kế hoạch gần như tức thì."""
+    name = 'pyfftw'
+    layout = 'half'
+
+    def __init__(self, threads=None, wisdom_path=FFTW_WISDOM_PATH):
+        self.threads = threads or FFT_WORKERS
+        self.wisdom_path = wisdom_path
+        self._plans = {}
+        self._lock = threading.Lock()
+        self.load_wisdom()
+
+    def load_wisdom(self):
+        if not os.path.exists(self.wisdom_path):
+            return
+        try:
+            with open(self.wisdom_path, 'r', encoding='utf-8') as f:
+                pyfftw.import_wisdom(tuple(base64.b64decode(w) for w in json.load(f)))
+        except (OSError, ValueError):
+            pass   # wisdom hỏng / khác phiên bản: lập kế hoạch lại từ đầu
+
+    def save_wisdom(self):
+        os.makedirs(os.path.dirname(self.wisdom_path) or '.', exist_ok=True)
+        with open(self.wisdom_path, 'w', encoding='utf-8') as f:
+            json.dump([base64.b64encode(w).decode('ascii') for w in pyfftw.export_wisdom()], f)
+
+    def _plan(self, direction, shape, dtype):
+        key = (direction, tuple(shape), np.dtype(dtype).name)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                with span('pyfftw.plan', 'fft', direction=direction, shape=shape, dtype=key[2]):
+                    plan = self._build_plan(direction, shape, dtype)
+                self._plans[key] = plan
+                self.save_wisdom()
+            return plan
+
+    def _build_plan(self, direction, shape, dtype):
+        if direction == 'forward':
+            a = pyfftw.empty_aligned(shape, dtype=dtype)
+            return pyfftw.builders.rfft2(a, threads=self.threads, planner_effort='FFTW_MEASURE')
+        a = pyfftw.empty_aligned(*self.spectrum_spec(shape, dtype))
+        return pyfftw.builders.irfft2(a, s=shape, threads=self.threads, planner_effort='FFTW_MEASURE')
+
+    def spectrum_spec(self, shape, dtype=np.float32):
+        return (shape[0], shape[1] // 2 + 1), complex_dtype(dtype)
+
+    def _run(self, plan, src, out):
+        # Mảng kết quả của kế hoạch bị ghi đè ở lần gọi sau nên luôn chép ra ngoài
+        with self._lock:
+            res = plan(src)
+            if out is None:
+                return res.copy()
+            np.copyto(out, res)
+            return out
+
+    def forward(self, y32, out=None):
+        return self._run(self._plan('forward', y32.shape, y32.dtype), y32, out)
+
+    def inverse(self, spectrum, shape, out=None):
+        return self._run(self._plan('inverse', shape, np.finfo(spectrum.dtype).dtype), spectrum, out)
+
+# =========================================
+# 2. Đăng ký / chọn backend
+# =========================================
+FFT_BACKENDS = {}
+_default_name = None
+probe_results = {}
+
+def register_backend(backend):
+    FFT_BACKENDS[backend.name] = backend
+
+register_backend(OpenCVBackend())
+register_backend(NumpyBackend())
+if scipy_fft is not None:
+    register_backend(ScipyBackend())
+if pyfftw is not None:
+    register_backend(PyFFTWBackend())
+
+def available_backends():
+    return list(FFT_BACKENDS)
+
+@traced()
+def probe_backends(shape=PROBE_SHAPE, repeats=PROBE_REPEATS):
+    """Đo một vòng DFT thuận + ngược (ms, lấy lần nhanh nhất) của từng backend trên ảnh `shape`."""
+    y32 = np.random.default_rng(0).random(shape, dtype=np.float32)
+    results = {}
+    for name, backend in FFT_BACKENDS.items():
+        backend.inverse(backend.forward(y32), shape)   # làm nóng (lập kế hoạch, nạp thư viện)
+        best = float('inf')
+        for _ in range(repeats):
+            with span('fft.probe_round', 'fft', backend=name) as sp:
+                backend.inverse(backend.forward(y32), shape)
+            best = min(best, sp.elapsed_ms)
+        results[name] = best
+    probe_results.clear()
+    probe_results.update(results)
+    return results
+
+def set_default_backend(name):
+    global _default_name
+    if name not in FFT_BACKENDS:
+        raise ValueError(f"FFT backend không hỗ trợ: {name}")
+    _default_name = name
+
+def get_backend(name=None):
+    """Backend theo tên (hoặc chính đối tượng backend). Không có tên thì dùng mặc định,
+    được chọn bằng probe_backends() ở lần gọi đầu tiên."""
+    global _default_name
+    if name is None:
+        if _default_name is None:
+            results = probe_backends()
+            _default_name = min(results, key=results.get)
+        name = _default_name
+    elif not isinstance(name, str):
+        return name
+    try:
+        return FFT_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"FFT backend không hỗ trợ: {name}") from None
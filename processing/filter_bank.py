@@ -0,0 +1,206 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from processing.precision import real_dtype
+from processing.tracing import span
+
+# Giới hạn bộ nhớ mặc định của bộ đệm lưới D / hàm truyền H (byte)
+FILTER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Các loại hàm truyền hỗ trợ; Butterworth cần thêm bậc n
+TRANSFER_KINDS = ('ILPF', 'IHPF', 'BLPF', 'BHPF', 'GLPF', 'GHPF')
+_BUTTERWORTH = ('BLPF', 'BHPF')
+DEFAULT_BUTTERWORTH_ORDER = 2
+
+def _readonly(arr):
+    arr.setflags(write=False)
+    return arr
+
+# =========================================
+# 1. Bộ đệm LRU giới hạn theo dung lượng
+# =========================================
+class _ByteLRU:
+    """Bộ đệm khóa -> mảng, loại mục dùng lâu nhất khi tổng byte vượt max_bytes.
+    An toàn đa luồng (tab Benchmark chạy ở luồng nền); mảng lưu trong cache là chỉ đọc."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        with self._lock:
+            arr = self._entries.get(key)
+            if arr is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return arr
+            self.misses += 1
+        # Tạo ngoài khóa để các luồng khác không phải chờ; trùng lặp hiếm và vô hại
+        with span('filter_bank.build', 'cache', kind=key[0]):
+            arr = _readonly(build())
+        with self._lock:
+            if key not in self._entries and arr.nbytes <= self.max_bytes:
+                self._entries[key] = arr
+                self.nbytes += arr.nbytes
+                while self.nbytes > self.max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self.nbytes -= old.nbytes
+        return arr
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'bytes': self.nbytes,
+                'entries': len(self._entries),
+            }
+
+_cache = _ByteLRU(FILTER_CACHE_MAX_BYTES)
+
+# =========================================
+# 2. Lưới khoảng cách D (một góc phần tư)
+# =========================================
+def _distance_quadrant(rows, cols, dft_rows=None, dft_cols=None, dtype=np.float64):
+    """D[i, j] = sqrt(i^2 + j^2) với 0 <= i <= rows//2, 0 <= j <= cols//2 (kiểu `dtype`).
+    Đây là khoảng cách tới tâm (rows//2, cols//2) theo |u - tâm|, |v - tâm|;
+    mọi giá trị của lưới đầy đủ đều nằm trong góc phần tư này.
+    Nếu DFT được đệm lên dft_rows x dft_cols, chỉ số tần số được đổi về thang của ảnh
+    gốc (i * rows / dft_rows) để D0 giữ nguyên ý nghĩa."""
+    dft_rows, dft_cols = dft_rows or rows, dft_cols or cols
+    dtype_name = np.dtype(dtype).name
+
+    def build():
+        du = np.arange(dft_rows // 2 + 1) * (rows / dft_rows)
+        dv = np.arange(dft_cols // 2 + 1) * (cols / dft_cols)
+        du, dv = du.astype(dtype_name), dv.astype(dtype_name)
+        return np.sqrt(du[:, None] ** 2 + dv[None, :] ** 2)
+    return _cache.get(('D', rows, cols, dft_rows, dft_cols, dtype_name), build)
+
+def _mirror(Q, rows, cols):
+    """Dựng mảng rows x cols từ góc phần tư Q theo đối xứng tâm: H[u, v] = Q[|u - cr|, |v - cc|]."""
+    cr, cc = rows // 2, cols // 2
+    Q = np.concatenate((Q[cr:0:-1], Q[:rows - cr]), axis=0)
+    return np.concatenate((Q[:, cc:0:-1], Q[:, :cols - cc]), axis=1)
+
+def _half_plane(Q, rows):
+    """H[u, v] chưa dịch tâm với đủ mọi hàng u, 0 <= v <= cols//2 (bố cục phổ của rfft2),
+    từ góc phần tư Q theo đối xứng H[u, v] = H[rows - u, v]."""
+    u = np.arange(rows)
+    return Q[np.minimum(u, rows - u)]
+
+def _pack_ccs(Q, rows, cols):
+    """Dựng H (rows x cols) theo bố cục phổ nén CCS của cv2.dft trên ảnh thực (chưa dịch tâm)
+    từ góc phần tư Q: mỗi ô nhận giá trị H của tần số mà nó lưu (phần thực hoặc ảo).
+    - Cột 1 .. (cols-1 hoặc cols-2): cặp Re/Im của tần số v = (j+1)//2, hàng u thật.
+    - Cột 0 (và cột cuối nếu cols chẵn): tần số v = 0 (v = cols/2) xếp dọc, u = (i+1)//2."""
+    u = np.arange(rows)
+    half = _half_plane(Q, rows)
+    H = np.empty((rows, cols), dtype=Q.dtype)
+    inner = np.arange(1, cols - 1 if cols % 2 == 0 else cols)
+    H[:, inner] = half[:, (inner + 1) // 2]
+    packed_rows = (u + 1) // 2
+    H[:, 0] = half[packed_rows, 0]
+    if cols % 2 == 0 and cols > 1:
+        H[:, cols - 1] = half[packed_rows, cols // 2]
+    return H
+
+def pack_ccs(H_centered):
+    """Chuyển H đã dịch tâm (rows x cols, đối xứng tâm) sang bố cục CCS chưa dịch tâm."""
+    rows, cols = H_centered.shape
+    return _pack_ccs(H_centered[rows // 2::-1, cols // 2::-1], rows, cols)
+
+def half_plane(H_centered):
+    """Chuyển H đã dịch tâm (rows x cols, đối xứng tâm) sang bố cục nửa mặt phẳng của rfft2."""
+    rows, cols = H_centered.shape
+    return _half_plane(H_centered[rows // 2::-1, cols // 2::-1], rows)
+
+def distance_grid(rows, cols, dtype=None):
+    """Lưới D đầy đủ (chỉ đọc) như create_D_matrix, dựng từ góc phần tư đã lưu đệm.
+    dtype mặc định theo chính sách độ chính xác (processing/precision.py)."""
+    dtype_name = real_dtype(dtype).name
+    return _cache.get(('D_full', rows, cols, dtype_name),
+                      lambda: _mirror(_distance_quadrant(rows, cols, dtype=dtype_name), rows, cols))
+
+# =========================================
+# 3. Hàm truyền H
+# =========================================
+def _transfer_quadrant(kind, D, D0, n):
+    """Công thức của từng bộ lọc trên góc phần tư D (giữ nguyên phép tính của bản gốc), tính theo
+    dtype của D. Tràn số mũ (D0 rất nhỏ, bậc n lớn) cho inf, tức đúng giới hạn H = 0 / 1."""
+    with np.errstate(over='ignore'):
+        return _transfer_formula(kind, D, D0, n)
+
+def _transfer_formula(kind, D, D0, n):
+    if kind == 'ILPF':
+        return np.where(D <= D0, 1.0, 0.0)
+    if kind == 'IHPF':
+        return np.where(D <= D0, 0.0, 1.0)
+    if kind == 'BLPF':
+        return 1 / (1 + (D / D0) ** (2 * n))
+    if kind == 'BHPF':
+        D = D.copy()
+        D[D == 0] = 1e-6   # Tránh chia cho 0
+        return 1 / (1 + (D0 / D) ** (2 * n))
+    if kind == 'GLPF':
+        return np.exp(-(D ** 2) / (2 * (D0 ** 2)))
+    if kind == 'GHPF':
+        return 1 - np.exp(-(D ** 2) / (2 * (D0 ** 2)))
+    raise ValueError(f"Loại bộ lọc tần số không hỗ trợ: {kind}")
+
+def get_transfer_function(kind, rows, cols, D0, n=None, dtype=None, layout='centered', dft_size=None):
+    """Hàm truyền H thực (chỉ đọc) dùng chung cho ảnh rows x cols, kiểu `dtype` (mặc định theo
+    chính sách độ chính xác; lưới D và công thức cũng tính ở độ chính xác này).
+    layout='centered': mảng rows x cols đã dịch tâm (như IHPF..GHPF gốc).
+    layout='ccs': mảng dft_size (mặc định rows x cols) theo bố cục phổ nén của cv2.dft trên
+    ảnh thực, chưa dịch tâm, nhân trực tiếp với phổ (không cần fftshift / ifftshift).
+    layout='half': mảng dft_rows x (dft_cols//2 + 1) chưa dịch tâm, khớp phổ của rfft2.
+    Khóa cache: (kind, layout, rows, cols, dft_size, D0, n, dtype). Chỉ tính công thức trên một
+    góc phần tư của lưới D rồi lấy đối xứng ra cả ảnh."""
+    if kind not in TRANSFER_KINDS:
+        raise ValueError(f"Loại bộ lọc tần số không hỗ trợ: {kind}")
+    if layout not in ('centered', 'ccs', 'half'):
+        raise ValueError(f"Bố cục hàm truyền không hỗ trợ: {layout}")
+    if kind in _BUTTERWORTH:
+        n = DEFAULT_BUTTERWORTH_ORDER if n is None else n
+    else:
+        n = None
+    rows, cols, D0 = int(rows), int(cols), float(D0)
+    P, Q = (rows, cols) if layout == 'centered' or dft_size is None else (int(s) for s in dft_size)
+    dtype_name = real_dtype(dtype).name
+
+    def build():
+        Hq = _transfer_quadrant(kind, _distance_quadrant(rows, cols, P, Q, dtype_name), D0, n)
+        if layout == 'ccs':
+            H = _pack_ccs(Hq, P, Q)
+        elif layout == 'half':
+            H = _half_plane(Hq, P)
+        else:
+            H = _mirror(Hq, rows, cols)
+        return H.astype(dtype_name, copy=False)
+    return _cache.get((kind, layout, rows, cols, P, Q, D0, n, dtype_name), build)
+
+# =========================================
+# 4. Thống kê / dọn bộ đệm
+# =========================================
+def filter_cache_info():
+    """{'hits', 'misses', 'hit_rate', 'bytes', 'entries'} của bộ đệm D / H."""
+    return _cache.info()
+
+def clear_filter_cache():
+    _cache.clear()
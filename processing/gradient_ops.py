@@ -0,0 +1,89 @@
+import numpy as np
+
+from processing.kernel_bank import get_gradient_pair
+from processing.tracing import traced
+
+# Số phần tử tối đa của một khối hàng (giới hạn bộ nhớ tạm)
+GRADIENT_CHUNK_ELEMS = 1 << 18
+
+GRADIENT_OUTPUTS = ('magnitude', 'l1', 'orientation', 'gx', 'gy')
+
+# =========================================
+# Toán tử gradient hợp nhất (Sobel / Scharr / Prewitt)
+# =========================================
+@traced()
+def gradient(img, kind='sobel', outputs=('magnitude',), out=None):
+    """Tính Gx, Gy trong một lượt theo từng khối hàng (đệm 0 như conv(A, k, 1)) rồi ghi
+    trực tiếp các đầu ra được yêu cầu: 'magnitude' (L2), 'l1', 'orientation' (radian,
+    arctan2(Gy, Gx)), 'gx', 'gy'. Chỉ cấp phát các mảng kết quả (float32, HxW);
+    `out` là tuple mảng đã cấp phát sẵn theo đúng thứ tự `outputs`. 'magnitude' được tính
+    bằng sqrt(Gx^2 + Gy^2) theo dtype của mảng kết quả: với out float64, kết quả trùng từng bit
+    với sqrt(Gx**2 + Gy**2) của conv (float64) trên ảnh nguyên.
+    Trả về tuple kết quả theo thứ tự `outputs`."""
+    for name in outputs:
+        if name not in GRADIENT_OUTPUTS:
+            raise ValueError(f"Đầu ra gradient không hỗ trợ: {name}")
+    _, ky = get_gradient_pair(kind)
+    s0, s1, s2 = (float(v) for v in ky[2])   # hệ số làm trơn (hàng dương của ky)
+
+    h, w = img.shape
+    if out is None:
+        out = tuple(np.empty((h, w), dtype=np.float32) for _ in outputs)
+    results = dict(zip(outputs, out))
+
+    rows = max(1, min(h, GRADIENT_CHUNK_ELEMS // max(w, 1)))
+    buf = np.zeros((rows + 2, w + 2), dtype=np.float32)   # khối đã đệm 0
+    dy = np.empty((rows, w + 2), dtype=np.float32)
+    dx = np.empty((rows + 2, w), dtype=np.float32)
+    gx = np.empty((rows, w), dtype=np.float32)
+    gy = np.empty((rows, w), dtype=np.float32)
+    tmp = np.empty((rows, w), dtype=np.float32)
+    sq = None   # Gy^2 theo dtype của 'magnitude' (chỉ cấp phát khi khác float32)
+
+    for r0 in range(0, h, rows):
+        r1 = min(h, r0 + rows)
+        n = r1 - r0
+        # Nạp hàng r0-1 .. r1 vào khối đệm (hàng ngoài ảnh = 0)
+        buf[:] = 0
+        src0, src1 = max(0, r0 - 1), min(h, r1 + 1)
+        buf[src0 - (r0 - 1):src1 - (r0 - 1), 1:w + 1] = img[src0:src1]
+        P = buf[:n + 2]
+
+        # Gy = làm trơn ngang của (P[i+2] - P[i])
+        d = dy[:n]
+        np.subtract(P[2:], P[:-2], out=d)
+        Gy, Gx, t = gy[:n], gx[:n], tmp[:n]
+        np.multiply(d[:, :-2], s0, out=Gy)
+        np.multiply(d[:, 1:-1], s1, out=t); Gy += t
+        np.multiply(d[:, 2:], s2, out=t); Gy += t
+
+        # Gx = làm trơn dọc của (P[:, j+2] - P[:, j])
+        d = dx[:n + 2]
+        np.subtract(P[:, 2:], P[:, :-2], out=d)
+        np.multiply(d[:-2], s0, out=Gx)
+        np.multiply(d[1:-1], s1, out=t); Gx += t
+        np.multiply(d[2:], s2, out=t); Gx += t
+
+        if 'gx' in results:
+            results['gx'][r0:r1] = Gx
+        if 'gy' in results:
+            results['gy'][r0:r1] = Gy
+        if 'orientation' in results:
+            np.arctan2(Gy, Gx, out=results['orientation'][r0:r1])
+        if 'l1' in results:
+            L1 = results['l1'][r0:r1]
+            np.abs(Gx, out=L1)
+            np.abs(Gy, out=t)
+            L1 += t
+        if 'magnitude' in results:
+            M = results['magnitude'][r0:r1]
+            if M.dtype == np.float32:
+                q = t
+            else:
+                sq = np.empty((rows, w), dtype=M.dtype) if sq is None else sq
+                q = sq[:n]
+            np.multiply(Gx, Gx, out=M, dtype=M.dtype)
+            np.multiply(Gy, Gy, out=q, dtype=M.dtype)
+            M += q
+            np.sqrt(M, out=M)
+    return tuple(results[name] for name in outputs)
@@ -0,0 +1,141 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+from processing.tracing import traced
+
+# Số luồng cho CLAHE (histogram từng ô và nội suy theo dải hàng)
+HIST_WORKERS = os.cpu_count() or 1
+
+def _map(func, items, workers):
+    if workers <= 1 or len(items) <= 1:
+        return [func(it) for it in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items))
+
+def _histogram(channel):
+    """Histogram 256 mức của mảng uint8 2D (kể cả mảng không liên tục, ví dụ một kênh màu)."""
+    return cv2.calcHist([channel], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+
+# =========================================
+# 1. Cân bằng histogram toàn ảnh
+# =========================================
+def equalize_lut(hist):
+    """LUT cân bằng từ histogram (cùng công thức với PIL ImageOps.equalize)."""
+    nonzero = hist[hist > 0]
+    if len(nonzero) <= 1:
+        return np.arange(256, dtype=np.uint8)
+    step = (int(nonzero.sum()) - int(nonzero[-1])) // 255
+    if step == 0:
+        return np.arange(256, dtype=np.uint8)
+    cdf = np.concatenate(([0], np.cumsum(hist[:-1])))   # CDF loại trừ mức hiện tại
+    return np.minimum((cdf + step // 2) // step, 255).astype(np.uint8)
+
+def _luma_lut(arr, lut_from_hist, out=None):
+    """Tra bảng trên kênh độ sáng: ảnh xám trực tiếp; ảnh RGB đổi sang YCrCb rồi tra một LUT
+    3 kênh (Y theo LUT, Cr/Cb giữ nguyên) ghi đè tại chỗ, chỉ dùng một mảng kết quả."""
+    if arr.ndim == 2:
+        return cv2.LUT(arr, lut_from_hist(_histogram(arr)), dst=out)
+    ycc = cv2.cvtColor(arr, cv2.COLOR_RGB2YCrCb, dst=out)
+    lut = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+    lut[:, 0] = lut_from_hist(_histogram(ycc[..., 0]))
+    cv2.LUT(ycc, lut.reshape(256, 1, 3), dst=ycc)
+    return cv2.cvtColor(ycc, cv2.COLOR_YCrCb2RGB, dst=ycc)
+
+@traced()
+def equalize(arr, out=None):
+    """Cân bằng histogram cho ảnh uint8 xám (HxW) hoặc RGB (HxWx3, chỉ cân bằng độ sáng Y).
+    `out`: mảng kết quả cấp phát sẵn cùng kích thước."""
+    if arr.dtype != np.uint8:
+        raise ValueError("equalize chỉ hỗ trợ ảnh uint8")
+    return _luma_lut(arr, equalize_lut, out)
+
+# =========================================
+# 2. CLAHE (cân bằng thích nghi, giới hạn tương phản)
+# =========================================
+def _clip_histogram(hist, limit):
+    """Cắt histogram tại `limit` và chia đều phần dư cho 256 mức (như OpenCV)."""
+    excess = int(np.maximum(hist - limit, 0).sum())
+    hist = np.minimum(hist, limit)
+    hist += excess // 256
+    residual = excess % 256
+    if residual:
+        step = max(256 // residual, 1)
+        hist[::step][:residual] += 1
+    return hist
+
+def _tile_edges(size, n):
+    return (np.arange(n + 1) * size) // n
+
+def _cells(size, edges):
+    """Chia trục thành các đoạn nằm giữa tâm hai ô liên tiếp: (đầu, cuối, ô trước, ô sau, trọng số).
+    Trong mỗi đoạn, 4 ô lân cận cố định nên có thể tra LUT cả khối một lần."""
+    n = len(edges) - 1
+    centers = (edges[:-1] + edges[1:] - 1) / 2.0
+    bounds = [0] + [int(np.floor(c)) + 1 for c in centers] + [size]
+    cells = []
+    for k in range(n + 1):
+        a, b = bounds[k], bounds[k + 1]
+        if a >= b:
+            continue
+        i0, i1 = max(k - 1, 0), min(k, n - 1)
+        if i0 == i1:
+            wgt = np.zeros(b - a, dtype=np.float32)
+        else:
+            wgt = ((np.arange(a, b) - centers[i0]) / (centers[i1] - centers[i0])).astype(np.float32)
+        cells.append((a, b, i0, i1, wgt))
+    return cells
+
+def _clahe_channel(y, out, clip_limit=2.0, grid=(8, 8), workers=None):
+    workers = workers or HIST_WORKERS
+    h, w = y.shape
+    gy, gx = min(grid[0], h), min(grid[1], w)
+    ys, xs = _tile_edges(h, gy), _tile_edges(w, gx)
+
+    # 1. LUT của từng ô: histogram -> cắt -> CDF (các ô chạy song song)
+    def tile_lut(idx):
+        i, j = divmod(idx, gx)
+        tile = y[ys[i]:ys[i + 1], xs[j]:xs[j + 1]]
+        area = tile.shape[0] * tile.shape[1]
+        hist = _histogram(tile)
+        if clip_limit > 0:
+            hist = _clip_histogram(hist, max(1, int(clip_limit * area / 256)))
+        return np.clip(np.rint(np.cumsum(hist) * (255.0 / area)), 0, 255).astype(np.float32)
+    luts = _map(tile_lut, range(gy * gx), workers)
+
+    # 2. Nội suy song tuyến giữa LUT của 4 ô lân cận; mỗi khối tra 4 LUT bằng cv2.LUT,
+    #    các dải hàng chạy song song
+    col_cells = _cells(w, xs)
+    def run(row_cell):
+        a, b, i0, i1, wy = row_cell
+        wy = wy[:, None]
+        for c, d, j0, j1, wx in col_cells:
+            block = y[a:b, c:d]
+            tl = cv2.LUT(block, luts[i0 * gx + j0])
+            tr = cv2.LUT(block, luts[i0 * gx + j1])
+            bl = cv2.LUT(block, luts[i1 * gx + j0])
+            br = cv2.LUT(block, luts[i1 * gx + j1])
+            tl += wx * (tr - tl)
+            bl += wx * (br - bl)
+            tl += wy * (bl - tl)
+            out[a:b, c:d] = np.rint(tl, out=tl)
+    _map(run, _cells(h, ys), workers)
+    return out
+
+@traced()
+def clahe(arr, clip_limit=2.0, grid=(8, 8), workers=None, out=None):
+    """CLAHE cho ảnh uint8 xám hoặc RGB (trên kênh Y). Ảnh được chia grid = (số ô dọc, số ô ngang);
+    histogram mỗi ô bị cắt tại clip_limit x (trung bình mỗi mức) rồi lấy CDF làm LUT,
+    mỗi pixel nội suy song tuyến giữa LUT của 4 ô có tâm gần nhất.
+    `out`: mảng kết quả cấp phát sẵn cùng kích thước."""
+    if arr.dtype != np.uint8:
+        raise ValueError("clahe chỉ hỗ trợ ảnh uint8")
+    if arr.ndim == 2:
+        out = np.empty_like(arr) if out is None else out
+        return _clahe_channel(arr, out, clip_limit, grid, workers)
+    ycc = cv2.cvtColor(arr, cv2.COLOR_RGB2YCrCb, dst=out)
+    y = ycc[..., 0]
+    _clahe_channel(np.ascontiguousarray(y), y, clip_limit, grid, workers)
+    return cv2.cvtColor(ycc, cv2.COLOR_YCrCb2RGB, dst=ycc)
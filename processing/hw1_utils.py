@@ -1,5 +1,6 @@
 import os, glob, cv2, numpy as np
 from config import TARGET_W, TARGET_H, OUTPUT_DIR, EXTS
+from processing.tracing import traced
 
 def list_images(folder):
     paths = []
@@ -7,6 +8,7 @@ def list_images(folder):
         paths.extend(glob.glob(os.path.join(folder, e)))
     return sorted(paths)
 
+@traced()
 def read_bgr(path, ensure_size=True):
     img = cv2.imread(path, cv2.IMREAD_COLOR)
     if img is None:
@@ -16,6 +18,7 @@ def read_bgr(path, ensure_size=True):
             img = cv2.resize(img, (TARGET_W, TARGET_H), interpolation=cv2.INTER_AREA)
     return img
 
+@traced()
 def save_jpg_png(base_name_no_ext, img_bgr):
     jpg = os.path.join(OUTPUT_DIR, f"{base_name_no_ext}.jpg")
     png = os.path.join(OUTPUT_DIR, f"{base_name_no_ext}.png")
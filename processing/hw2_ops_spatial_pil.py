@@ -1,204 +1,205 @@
 import numpy as np
-from PIL import Image, ImageOps, ImageFilter
+from PIL import Image
 
-# =========================================
-# 1. Hàm tích chập (Conv)
-# =========================================
-def conv(A, k, b=0):
-    kh, kw = k.shape
-    if b > 0:
-        h, w = A.shape
-        B = np.zeros((h + kh - 1, w + kw - 1)) 
-        th = int(kh / 2)
-        tw = int(kw / 2)
-        B[th:h + th, tw:w + tw] = A
-        A = B
-    
-    h, w = A.shape
-    C = np.zeros((h, w)) 
-    
-    for i in range(0, h - kh + 1):
-        for j in range(0, w - kw + 1):
-            sA = A[i:i + kh, j:j + kw]
-            C[i, j] = np.sum(k * sA)
-            
-    C = C[0:h - kh + 1, 0:w - kw + 1]
-    return C
+from processing.conv_engine import box_filter, conv_multichannel
+from processing.kernel_bank import get_kernel
+from processing.gradient_ops import gradient
+from processing.point_ops import build_lut, apply_lut
+from processing.histogram_ops import equalize, clahe
+from processing.image_buffer import ImageBuffer, unwrap, wrap_like
+from processing.buffer_arena import get_buffer
+from processing.tiling import tiled, run_tiled_array
+from processing.rank_filters import rank_extreme_filter, min_max_filter, median_filter_hist
+from processing.tracing import traced
+
+# Mọi hàm nhận ảnh PIL hoặc ImageBuffer và trả về cùng kiểu với đầu vào.
+# `out` (tùy chọn): mảng uint8 cấp phát sẵn để ghi kết quả (ảnh trả về dùng chung bộ nhớ với
+# `out` khi đầu vào là ImageBuffer); `scratch`: BufferArena cho các mảng tạm (xem trước trực tiếp).
+def _rgb(image):
+    if isinstance(image, ImageBuffer):
+        return image.to_rgb()
+    return np.asarray(image.convert('RGB'))
+
+def _gray(image):
+    # Ảnh màu luôn đổi sang xám bằng PIL convert('L'): cv2 RGB2GRAY làm tròn khác nên xem trước
+    # trên ImageBuffer sẽ lệch vài pixel so với khi áp dụng trên ảnh PIL
+    if isinstance(image, ImageBuffer):
+        if image.order == 'GRAY':
+            return image.to_gray()
+        image = image.to_pil()
+    return np.asarray(image.convert('L'))
 
 # =========================================
-# 2. Biến đổi cường độ (Transform)
+# 1. Biến đổi cường độ (Transform)
 # =========================================
-def negative(image):
+@traced()
+def negative(image, out=None):
     """Âm bản. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    if image.mode == 'L':
-        return ImageOps.invert(image)
-    
-    np_img = np.array(image)
-    np_negative = 255 - np_img
-    return Image.fromarray(np_negative)
+    np_img, mode = unwrap(image)
+    np_negative = apply_lut(np_img, build_lut('negative'), out=out)
+    return wrap_like(image, np_negative, mode)
 
-def log_transform_pil(image, c):
+@traced()
+def log_transform_pil(image, c, out=None):
     """Biến đổi Log. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    img_rgb = image.convert('RGB')
-    img_array = np.array(img_rgb, dtype=np.float64)
-    # Thêm 1e-6 để tránh log(0)
-    s = c * np.log(1.0 + img_array + 1e-6)
-    s = np.clip(s, 0, 255)
-    return Image.fromarray(s.astype(np.uint8), 'RGB')
-
-def gamma_transform_pil(image, c, gamma):
+    s = apply_lut(_rgb(image), build_lut('log', float(c)), out=out)
+    return wrap_like(image, s, 'RGB')
+
+@traced()
+def gamma_transform_pil(image, c, gamma, out=None):
     """Biến đổi Gamma. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    img = np.array(image, dtype=np.float64) / 255.0
-    s = c * np.power(img, gamma)
-    s = np.clip(s * 255.0, 0, 255)
-    return Image.fromarray(s.astype(np.uint8), 'RGB')
+    s = apply_lut(_rgb(image), build_lut('gamma', float(c), float(gamma)), out=out)
+    return wrap_like(image, s, 'RGB')
 
-def piecewise_linear_pil(image, low, high):
+@traced()
+def piecewise_linear_pil(image, low, high, out=None):
     """Biến đổi tuyến tính (dùng interp như GUI cũ)."""
-    # Chuyển low, high (0-1) về 0-255
-    low_val = low * 255.0
-    high_val = high * 255.0
-    
-    # Tạo bảng tra (LUT)
-    lut = np.interp(np.arange(256),
-                    [0, 127, 255], # Điểm vào
-                    [0, low_val, high_val] # Điểm ra
-                   ).astype(np.uint8)
-    
-    if image.mode == 'L':
-        return image.point(lut)
-    
-    # Áp dụng cho từng kênh nếu là ảnh màu
-    channels = image.split()
-    processed_channels = [ch.point(lut) for ch in channels]
-    return Image.merge(image.mode, processed_channels)
-
-def equalize_histogram_pil(image):
-    """Cân bằng histogram (dùng PIL)."""
-    if image.mode == 'L':
-        return ImageOps.equalize(image)
-    
-    # Xử lý ảnh màu
-    img_yuv = image.convert('YUV')
-    channels = img_yuv.split()
-    y_equalized = ImageOps.equalize(channels[0])
-    img_equalized = Image.merge('YUV', (y_equalized, channels[1], channels[2]))
-    return img_equalized.convert('RGB')
-
-def threshold_filter_pil(image, threshold_val):
-    """Lọc ngưỡng (dùng PIL)."""
-    img_gray = image.convert('L') # Chuyển sang ảnh xám
-    # 1 (Trắng) nếu > threshold, 0 (Đen) nếu <=
-    img_thresh = img_gray.point(lambda p: 255 if p > threshold_val else 0)
-    return img_thresh.convert(image.mode) # Chuyển về mode cũ (đen/trắng)
+    img_array, mode = unwrap(image)
+    s = apply_lut(img_array, build_lut('piecewise', float(low), float(high)), out=out)
+    return wrap_like(image, s, mode)
+
+@traced()
+def equalize_histogram_pil(image, out=None):
+    """Cân bằng histogram (ảnh màu: chỉ cân bằng kênh độ sáng Y)."""
+    # Histogram -> LUT theo CDF -> tra bảng tại chỗ (không tách/ghép kênh bằng PIL)
+    img, mode = unwrap(image)
+    return wrap_like(image, equalize(img, out=out), mode)
+
+@traced()
+def clahe_pil(image, clip_limit=2.0, grid=8, out=None):
+    """CLAHE: cân bằng thích nghi theo ô grid x grid, giới hạn tương phản clip_limit."""
+    img, mode = unwrap(image)
+    return wrap_like(image, clahe(img, float(clip_limit), (int(grid), int(grid)), out=out), mode)
+
+@traced()
+def threshold_filter_pil(image, threshold_val, out=None):
+    """Lọc ngưỡng (dùng PIL). `out` là mảng xám HxW."""
+    img_thresh = apply_lut(_gray(image), build_lut('threshold', float(threshold_val)), out=out)
+    if isinstance(image, ImageBuffer):
+        return ImageBuffer(img_thresh, 'GRAY') # Chuyển sang màu khi nơi dùng cần
+    return Image.fromarray(img_thresh, 'L').convert(image.mode) # Chuyển về mode cũ (đen/trắng)
 
 # =========================================
-# 3. Lọc không gian (Filter)
+# 2. Lọc không gian (Filter)
 # =========================================
-def average_filter(image, n):
+@traced()
+def average_filter(image, n, out=None, scratch=None):
     """Lọc trung bình. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    k = np.ones((n, n)) / (n ** 2)
-    r, g, b = image.split()
-    r, g, b = np.array(r), np.array(g), np.array(b)
-    
-    R = conv(r, k, 1)
-    G = conv(g, k, 1)
-    B = conv(b, k, 1)
-    
-    return Image.merge('RGB', (Image.fromarray(R.astype('uint8')),
-                                 Image.fromarray(G.astype('uint8')),
-                                 Image.fromarray(B.astype('uint8'))))
+    img = _rgb(image)
+    mean = box_filter(img, n, out=get_buffer(scratch, 'mean', img.shape, np.float64), scratch=scratch)
+    np.rint(mean, out=mean)
+    np.clip(mean, 0, 255, out=mean)
+    if out is None:
+        out = np.empty(img.shape, dtype=np.uint8)
+    np.copyto(out, mean, casting='unsafe')
+    return wrap_like(image, out, 'RGB')
 
-def gaussian_filter_pil(image, n, sigma=1.0):
+@traced()
+def gaussian_filter_pil(image, n, sigma=1.0, out=None, scratch=None):
     """Lọc Gaussian. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    k = np.zeros((n, n))
-    mid = n // 2
-    for i in range(n):
-        for j in range(n):
-            x = i - mid
-            y = j - mid
-            k[i, j] = (1 / (2 * np.pi * sigma ** 2)) * np.exp(-(x ** 2 + y ** 2) / (2 * sigma ** 2))
-    k /= np.sum(k)
-    
-    r, g, b = image.split()
-    r, g, b = np.array(r), np.array(g), np.array(b)
-    
-    R = conv(r, k, 1)
-    G = conv(g, k, 1)
-    B = conv(b, k, 1)
-    
-    return Image.merge('RGB', (Image.fromarray(R.astype('uint8')),
-                                 Image.fromarray(G.astype('uint8')),
-                                 Image.fromarray(B.astype('uint8'))))
+    k = get_kernel('gaussian', n, sigma, dtype=np.float32)
+    return wrap_like(image, conv_multichannel(_rgb(image), k, out=out, scratch=scratch), 'RGB')
 
-def median_filter(image, n):
+@traced()
+def median_filter(image, n, out=None, scratch=None):
     """Lọc trung vị. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    # Dùng hàm `median_filter` (hỗ trợ cả ảnh PIL)
-    return image.filter(ImageFilter.MedianFilter(size=n))
+    # Histogram trượt theo dải cột song song (kết quả giống ImageFilter.MedianFilter)
+    img, mode = unwrap(image)
+    return wrap_like(image, median_filter_hist(img, n, out=out, scratch=scratch), mode)
 
-def max_min_filter(image, n, filter_type='min'):
+@traced()
+def max_min_filter(image, n, filter_type='min', out=None, scratch=None):
     """Lọc Min/Max. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    # Dùng hàm `max_min_filter` (hỗ trợ cả ảnh PIL)
-    if filter_type == 'min':
-        return image.filter(ImageFilter.MinFilter(size=n))
-    else:
-        return image.filter(ImageFilter.MaxFilter(size=n))
+    # Min/Max trượt van Herk/Gil-Werman (biên lặp lại như ImageFilter.MinFilter/MaxFilter)
+    img, mode = unwrap(image)
+    result = rank_extreme_filter(img, n, filter_type, out=out, scratch=scratch)
+    return wrap_like(image, result, mode)
 
-def midpoint_filter(image, n):
+@traced()
+def midpoint_filter(image, n, out=None, scratch=None):
     """Lọc Midpoint. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    # Dùng hàm `midpoint_filter` 
-    img = np.array(image, dtype=np.uint8)
-    h, w, c = img.shape
-    s = n // 2
-    padded_img = np.pad(img, ((s, s), (s, s), (0, 0)), mode='edge')
-    Imid = np.zeros((h, w, c), np.uint8)
-    
-    for ch in range(c):
-        for i in range(h):
-            for j in range(w):
-                region = padded_img[i:i + n, j:j + n, ch]
-                Imin = np.min(region)
-                Imax = np.max(region)
-                Imid[i, j, ch] = (Imin + Imax) / 2
-                
-    return Image.fromarray(Imid, mode='RGB')
-
-def sobel_filter_pil(image):
+    img, mode = unwrap(image)
+    Imin, Imax = min_max_filter(img, n, out=(get_buffer(scratch, 'mid_min', img.shape),
+                                             get_buffer(scratch, 'mid_max', img.shape)), scratch=scratch)
+    # Cộng trên uint16 để tránh tràn số uint8
+    acc = get_buffer(scratch, 'mid_sum', img.shape, np.uint16)
+    np.add(Imin, Imax, out=acc, dtype=np.uint16)
+    acc //= 2
+    if out is None:
+        out = np.empty(img.shape, dtype=np.uint8)
+    np.copyto(out, acc, casting='unsafe')
+    return wrap_like(image, out, mode)
+
+def _sobel_magnitude(img, out=None):
+    """Độ lớn gradient Sobel của ảnh xám float32 (phép toán cục bộ, bán kính 1).
+    Kết quả float64 như bản conv cũ để ảnh 8 bit sau chuẩn hoá trùng từng bit."""
+    if out is None:
+        out = np.empty(img.shape, dtype=np.float64)
+    Gm, = gradient(img, 'sobel', ('magnitude',), out=(out,))
+    return Gm
+
+def _sobel_to_image(image, Gm, out=None):
+    """Chuẩn hóa theo max toàn ảnh về 0-255, trả về cùng kiểu với ảnh đầu vào. `out` là mảng xám HxW."""
+    g_max = Gm.max()
+    if g_max > 0:
+        # Cùng thứ tự phép tính với Gm * 255.0 / Gm.max() của bản gốc
+        Gm *= 255.0
+        Gm /= g_max
+    
+    np.clip(Gm, 0, 255, out=Gm)
+    if out is None:
+        out = np.empty(Gm.shape, dtype=np.uint8)
+    np.copyto(out, Gm, casting='unsafe')
+    
+    if isinstance(image, ImageBuffer):
+        return ImageBuffer(out, 'GRAY')
+    return Image.fromarray(out, 'L').convert(image.mode)
+
+def _gray_float(image, scratch=None):
+    gray = _gray(image)
+    img = get_buffer(scratch, 'gray_f32', gray.shape, np.float32)
+    np.copyto(img, gray)
+    return img
+
+@traced()
+def sobel_filter_pil(image, out=None, scratch=None):
     """Lọc Sobel. Mong đợi ảnh PIL, trả về ảnh PIL."""
-    # Dùng hàm `sobel_filter` 
-    img_l = image.convert('L') # Chuyển sang ảnh xám
-    img = np.array(img_l, dtype=np.float32)
-    is_pil = True
-    
-    ky = np.array([[-1.0, -2, -1], [0, 0, 0], [1, 2, 1]], dtype=np.float32)
-    kx = np.transpose(ky)
-    
-    Gx = conv(img, kx, 1)
-    Gy = conv(img, ky, 1)
-    
-    Gm = np.sqrt(Gx**2 + Gy**2)
-    
-    if Gm.max() > 0:
-        Gm = (Gm * 255.0 / Gm.max())
-    
-    Gm = np.clip(Gm, 0, 255).astype(np.uint8)
-    
-    return Image.fromarray(Gm, 'L').convert(image.mode)
+    img = _gray_float(image, scratch) # Ảnh xám
+    Gm = _sobel_magnitude(img, get_buffer(scratch, 'sobel_mag', img.shape, np.float64))
+    return _sobel_to_image(image, Gm, out)
+
+@traced()
+def sobel_filter_tiled(image, k=3, out=None, scratch=None):
+    """Sobel theo ô song song: chỉ phần gradient được chia ô, chuẩn hóa max chạy trên toàn ảnh."""
+    img = _gray_float(image, scratch)
+    Gm = run_tiled_array(_sobel_magnitude, img, halo=1,
+                         out=get_buffer(scratch, 'sobel_mag', img.shape, np.float64))
+    return _sobel_to_image(image, Gm, out)
 
 # =========================================
-# 4. Alias (bí danh) cho GUI
+# 3. Alias (bí danh) cho GUI
 # =========================================
 negative_image = negative
 log_transform = log_transform_pil
 gamma_transform = gamma_transform_pil
 piecewise_linear = piecewise_linear_pil
 equalize_histogram = equalize_histogram_pil
+clahe_equalize = clahe_pil
 threshold_filter_basic = threshold_filter_pil
 
 mean_filter_basic = average_filter
-gaussian_filter_basic = lambda img, k: gaussian_filter_pil(img, k, sigma=1.0) # Thêm sigma
+gaussian_filter_basic = lambda img, k, **kw: gaussian_filter_pil(img, k, sigma=1.0, **kw) # Thêm sigma
 median_filter_basic = median_filter
-min_filter_basic = lambda img, k: max_min_filter(img, k, 'min')
-max_filter_basic = lambda img, k: max_min_filter(img, k, 'max')
+min_filter_basic = lambda img, k, **kw: max_min_filter(img, k, 'min', **kw)
+max_filter_basic = lambda img, k, **kw: max_min_filter(img, k, 'max', **kw)
 midpoint_filter_basic = midpoint_filter
-sobel_filter_basic = lambda img, k: sobel_filter_pil(img) # Bỏ qua k_size
\ No newline at end of file
+sobel_filter_basic = lambda img, k, **kw: sobel_filter_pil(img, **kw) # Bỏ qua k_size
+
+# Phiên bản chạy song song theo ô (halo = bán kính kernel), kết quả giống hệt bản gốc.
+# Median không có bản theo ô: median_filter_hist đã song song theo dải cột, chia ô nữa
+# chỉ lồng thread pool (mỗi ô một pool) mà không nhanh hơn.
+mean_filter_tiled = tiled(mean_filter_basic)
+gaussian_filter_tiled = tiled(gaussian_filter_basic)
+min_filter_tiled = tiled(min_filter_basic)
+max_filter_tiled = tiled(max_filter_basic)
+midpoint_filter_tiled = tiled(midpoint_filter_basic)
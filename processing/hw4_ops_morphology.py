@@ -3,6 +3,11 @@ import numpy as np
 import math
 from PIL import Image
 
+from processing.image_buffer import as_gray
+from processing.buffer_arena import get_buffer
+from processing.kernel_bank import get_structuring_element
+from processing.tracing import traced
+
 DISPLAY_SIZE = 250
 
 def _visualize_kernel(kernel):
@@ -37,20 +42,24 @@ def get_morphology_elements(params):
     if ksize < 3: ksize = 3
     
     if 'Rect' in se_type_str:
-        se_type = cv.MORPH_RECT
+        se_type = 'rect'
     elif 'Cross' in se_type_str:
-        se_type = cv.MORPH_CROSS
+        se_type = 'cross'
     elif 'Ellipse' in se_type_str:
-        se_type = cv.MORPH_ELLIPSE
+        se_type = 'ellipse'
     else:
-        se_type = cv.MORPH_RECT
+        se_type = 'rect'
 
-    kernel = cv.getStructuringElement(se_type, (ksize, ksize))
+    kernel = get_structuring_element(se_type, ksize)
     return kernel, iterations, ksize
 
-def execute_morphology(img_original_cv, alg, params):    
+@traced()
+def execute_morphology(img_original_cv, alg, params, out=None, scratch=None):    
+    # out: mảng xám cấp phát sẵn cho kết quả cuối; scratch: BufferArena cho ảnh nhị phân / bước trung gian
+    img_original_cv = as_gray(img_original_cv)
     thres_val = int(float(params['thres_morph'].get()))
-    _, img_binary = cv.threshold(img_original_cv, thres_val, 255, cv.THRESH_BINARY)
+    _, img_binary = cv.threshold(img_original_cv, thres_val, 255, cv.THRESH_BINARY,
+                                 dst=get_buffer(scratch, 'morph_binary', img_original_cv.shape))
     
     kernel, iterations, ksize = get_morphology_elements(params)
     
@@ -58,13 +67,13 @@ def execute_morphology(img_original_cv, alg, params):
     op_name = alg.split(': ')[1]
     
     if op_name == "Erosion":
-        result_img = cv.erode(img_binary, kernel, iterations=iterations)
+        result_img = cv.erode(img_binary, kernel, dst=out, iterations=iterations)
     elif op_name == "Dilation":
-        result_img = cv.dilate(img_binary, kernel, iterations=iterations)
+        result_img = cv.dilate(img_binary, kernel, dst=out, iterations=iterations)
     elif op_name == "Opening":
-        result_img = cv.morphologyEx(img_binary, cv.MORPH_OPEN, kernel, iterations=iterations)
+        result_img = cv.morphologyEx(img_binary, cv.MORPH_OPEN, kernel, dst=out, iterations=iterations)
     elif op_name == "Closing":
-        result_img = cv.morphologyEx(img_binary, cv.MORPH_CLOSE, kernel, iterations=iterations)
+        result_img = cv.morphologyEx(img_binary, cv.MORPH_CLOSE, kernel, dst=out, iterations=iterations)
 
     results = [
         (f'Binary Input (T={thres_val})', img_binary),
@@ -72,14 +81,18 @@ def execute_morphology(img_original_cv, alg, params):
     ]
     
     if op_name == "Opening":
-        img_eroded = cv.erode(img_binary, kernel, iterations=iterations)
+        img_eroded = cv.erode(img_binary, kernel, dst=get_buffer(scratch, 'morph_step', img_binary.shape),
+                              iterations=iterations)
         results.insert(1, ('Step 1: Erosion', img_eroded))
     elif op_name == "Closing":
-        img_dilated = cv.dilate(img_binary, kernel, iterations=iterations)
+        img_dilated = cv.dilate(img_binary, kernel, dst=get_buffer(scratch, 'morph_step', img_binary.shape),
+                                iterations=iterations)
         results.insert(1, ('Step 1: Dilation', img_dilated))
     return results
 
+@traced()
 def execute_homework(img_original_cv, params):    
+    img_original_cv = as_gray(img_original_cv)
     # Lấy tham số ngưỡng và kích thước SE cho Boundary Extraction
     thres_val = int(float(params['thres_hw'].get()))
     se_size_boundary = int(float(params['se_size_hw'].get()))
@@ -97,7 +110,7 @@ def execute_homework(img_original_cv, params):
     results.append(('HW4-1: Erosion (Custom SE)', img_erode_custom))
     results.append(('HW4-1: Dilation (Custom SE)', img_dilate_custom))
     # --- HW4-2: Boundary Extraction (Trích Biên) ---
-    kernel_boundary = cv.getStructuringElement(cv.MORPH_RECT, (se_size_boundary, se_size_boundary))
+    kernel_boundary = get_structuring_element('rect', se_size_boundary)
     # 1. Thực hiện Erosion: A ⊖ B
     img_A_eroded_B = cv.erode(img_A, kernel_boundary, iterations=1)
     # 2. Thực hiện Phép Hiệu (Set Difference): A - (A ⊖ B)
@@ -0,0 +1,126 @@
+import numpy as np
+import cv2
+from PIL import Image
+
+# Bảng chuyển đổi thứ tự kênh giữa các bố cục được hỗ trợ
+_CONVERSIONS = {
+    ('BGR', 'RGB'): cv2.COLOR_BGR2RGB,
+    ('RGB', 'BGR'): cv2.COLOR_RGB2BGR,
+    ('BGR', 'GRAY'): cv2.COLOR_BGR2GRAY,
+    ('RGB', 'GRAY'): cv2.COLOR_RGB2GRAY,
+    ('GRAY', 'BGR'): cv2.COLOR_GRAY2BGR,
+    ('GRAY', 'RGB'): cv2.COLOR_GRAY2RGB,
+}
+
+# =========================================
+# 1. Bộ đệm ảnh dùng chung
+# =========================================
+class ImageBuffer:
+    """Ảnh uint8 trên một mảng NumPy liên tục, kèm thứ tự kênh ('BGR', 'RGB', 'GRAY').
+    Dữ liệu chỉ đọc nên có thể chia sẻ giữa các tab mà không cần sao chép; các bố cục
+    khác (RGB cho PIL, BGR cho OpenCV, GRAY) chỉ được chuyển đổi khi cần và lưu đệm."""
+
+    def __init__(self, data, order='BGR'):
+        data = np.ascontiguousarray(data)
+        if data.ndim == 2:
+            order = 'GRAY'
+        if order not in ('BGR', 'RGB', 'GRAY'):
+            raise ValueError(f"Thứ tự kênh không hỗ trợ: {order}")
+        view = data.view()
+        view.flags.writeable = False
+        self.order = order
+        self._views = {order: view}
+        self._pil = None
+
+    @classmethod
+    def from_file(cls, path):
+        """Giải mã file ảnh một lần (ảnh xám / có alpha đều được đưa về BGR)."""
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"Không thể đọc ảnh: {path}")
+        return cls(img, 'BGR')
+
+    @classmethod
+    def from_pil(cls, image):
+        if image.mode == 'L':
+            return cls(np.asarray(image), 'GRAY')
+        return cls(np.asarray(image.convert('RGB')), 'RGB')
+
+    @property
+    def data(self):
+        return self._views[self.order]
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def height(self):
+        return self.data.shape[0]
+
+    @property
+    def width(self):
+        return self.data.shape[1]
+
+    @property
+    def mode(self):
+        """Chế độ PIL tương ứng ('L' hoặc 'RGB')."""
+        return 'L' if self.order == 'GRAY' else 'RGB'
+
+    def view(self, order):
+        """Mảng chỉ đọc theo thứ tự kênh `order`; không sao chép nếu trùng bố cục gốc."""
+        if order not in self._views:
+            arr = cv2.cvtColor(self.data, _CONVERSIONS[(self.order, order)])
+            arr.flags.writeable = False
+            self._views[order] = arr
+        return self._views[order]
+
+    def to_cv(self):
+        return self.view('BGR')
+
+    def to_rgb(self):
+        return self.view('RGB')
+
+    def to_gray(self):
+        return self.view('GRAY')
+
+    def to_pil(self):
+        """Ảnh PIL (lưu đệm). Ảnh xám dùng chung bộ nhớ; ảnh màu phải chép sang bố cục của PIL."""
+        if self._pil is None:
+            if self.order == 'GRAY':
+                self._pil = Image.frombuffer('L', (self.width, self.height), self.data, 'raw', 'L', 0, 1)
+            else:
+                self._pil = Image.fromarray(self.to_rgb(), 'RGB')
+        return self._pil
+
+    def copy(self):
+        return ImageBuffer(self.data.copy(), self.order)
+
+# =========================================
+# 2. Tiện ích cho các hàm xử lý (PIL / ImageBuffer / mảng BGR)
+# =========================================
+def unwrap(image):
+    """Trả về (mảng, mode PIL) cho ảnh PIL hoặc ImageBuffer (mảng RGB hoặc xám)."""
+    if isinstance(image, ImageBuffer):
+        arr = image.to_gray() if image.order == 'GRAY' else image.to_rgb()
+        return arr, image.mode
+    return np.asarray(image), image.mode
+
+def wrap_like(image, arr, mode):
+    """Đóng gói kết quả cùng kiểu với đầu vào: ImageBuffer vào -> ImageBuffer ra, PIL -> PIL."""
+    if isinstance(image, ImageBuffer):
+        return ImageBuffer(arr, 'GRAY' if mode == 'L' else 'RGB')
+    return Image.fromarray(arr, mode=mode)
+
+def as_bgr(image):
+    """Mảng BGR cho ImageBuffer hoặc mảng OpenCV (giữ nguyên nếu đã là mảng)."""
+    if isinstance(image, ImageBuffer):
+        return image.to_cv()
+    return image
+
+def as_gray(image):
+    if isinstance(image, ImageBuffer):
+        return image.to_gray()
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
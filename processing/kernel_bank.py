@@ -0,0 +1,87 @@
+from functools import lru_cache
+
+import numpy as np
+import cv2 as cv
+
+# Kích thước tối đa của mỗi bộ nhớ đệm LRU
+KERNEL_CACHE_SIZE = 128
+
+# Hệ số đạo hàm theo trục y (hàng); kernel trục x là chuyển vị
+_GRADIENT_KY = {
+    'sobel': [[-1, -2, -1], [0, 0, 0], [1, 2, 1]],
+    'prewitt': [[-1, -1, -1], [0, 0, 0], [1, 1, 1]],
+    'scharr': [[-3, -10, -3], [0, 0, 0], [3, 10, 3]],
+}
+
+_SE_SHAPES = {
+    'rect': cv.MORPH_RECT,
+    'cross': cv.MORPH_CROSS,
+    'ellipse': cv.MORPH_ELLIPSE,
+}
+
+def _readonly(arr):
+    arr.setflags(write=False)
+    return arr
+
+# =========================================
+# 1. Kernel lọc không gian
+# =========================================
+@lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def _build_kernel(kind, size, sigma, dtype_name):
+    if kind == 'gaussian':
+        x = np.arange(size) - size // 2
+        g = np.exp(-(x ** 2) / (2 * sigma ** 2))
+        k = np.outer(g, g)
+        k /= np.sum(k)
+    elif kind == 'mean':
+        k = np.ones((size, size)) / (size ** 2)
+    else:
+        raise ValueError(f"Loại kernel không hỗ trợ: {kind}")
+    return _readonly(k.astype(dtype_name))
+
+def get_kernel(kind, size, sigma=1.0, dtype=np.float64):
+    """Kernel n x n ('gaussian' hoặc 'mean') dùng chung, chỉ đọc.
+    Khóa cache: (kind, size, sigma, dtype)."""
+    sigma = float(sigma) if kind == 'gaussian' else None
+    return _build_kernel(kind, int(size), sigma, np.dtype(dtype).name)
+
+@lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def _build_gradient_pair(kind, dtype_name):
+    if kind not in _GRADIENT_KY:
+        raise ValueError(f"Loại kernel đạo hàm không hỗ trợ: {kind}")
+    ky = np.array(_GRADIENT_KY[kind], dtype=dtype_name)
+    kx = np.ascontiguousarray(ky.T)
+    return _readonly(kx), _readonly(ky)
+
+def get_gradient_pair(kind='sobel', dtype=np.float32):
+    """Cặp kernel đạo hàm (kx, ky) 3x3: 'sobel', 'prewitt' hoặc 'scharr'."""
+    return _build_gradient_pair(kind, np.dtype(dtype).name)
+
+# =========================================
+# 2. Phần tử cấu trúc (Morphology)
+# =========================================
+@lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def _build_structuring_element(shape, ksize):
+    return _readonly(cv.getStructuringElement(_SE_SHAPES[shape], (ksize, ksize)))
+
+def get_structuring_element(shape, ksize):
+    """Phần tử cấu trúc ksize x ksize ('rect', 'cross', 'ellipse'), chỉ đọc."""
+    return _build_structuring_element(shape, int(ksize))
+
+# =========================================
+# 3. Thống kê cache
+# =========================================
+def kernel_cache_info():
+    """Số lần hit/miss và kích thước của từng bộ nhớ đệm."""
+    info = {}
+    for name, func in (('kernel', _build_kernel),
+                       ('gradient', _build_gradient_pair),
+                       ('structuring_element', _build_structuring_element)):
+        ci = func.cache_info()
+        info[name] = {'hits': ci.hits, 'misses': ci.misses, 'size': ci.currsize}
+    return info
+
+def clear_kernel_cache():
+    _build_kernel.cache_clear()
+    _build_gradient_pair.cache_clear()
+    _build_structuring_element.cache_clear()
@@ -0,0 +1,99 @@
+from functools import lru_cache
+
+import numpy as np
+import cv2
+
+from processing.tracing import traced
+
+# Số bảng tra (LUT) tối đa giữ trong bộ nhớ đệm
+LUT_CACHE_SIZE = 256
+
+_LEVELS = np.arange(256, dtype=np.float64)
+
+# =========================================
+# 1. Xây dựng bảng tra 256 mức (uint8 -> uint8)
+# =========================================
+def _negative_lut():
+    return 255.0 - _LEVELS
+
+def _log_lut(c):
+    # Thêm 1e-6 để tránh log(0)
+    return np.clip(c * np.log(1.0 + _LEVELS + 1e-6), 0, 255)
+
+def _gamma_lut(c, gamma):
+    s = c * np.power(_LEVELS / 255.0, gamma)
+    return np.clip(s * 255.0, 0, 255)
+
+def _piecewise_lut(low, high):
+    # low, high (0-1) -> điểm ra tại 127 và 255
+    return np.interp(_LEVELS, [0, 127, 255], [0, low * 255.0, high * 255.0])
+
+def _threshold_lut(threshold_val):
+    # 1 (Trắng) nếu > threshold, 0 (Đen) nếu <=
+    return np.where(_LEVELS > threshold_val, 255.0, 0.0)
+
+_LUT_BUILDERS = {
+    'negative': _negative_lut,
+    'log': _log_lut,
+    'gamma': _gamma_lut,
+    'piecewise': _piecewise_lut,
+    'threshold': _threshold_lut,
+}
+
+@lru_cache(maxsize=LUT_CACHE_SIZE)
+def build_lut(name, *params):
+    """LUT uint8 (256 phần tử, chỉ đọc) cho phép biến đổi điểm `name` với tham số `params`.
+    Giá trị bị cắt về [0, 255] rồi làm tròn xuống như các hàm float cũ."""
+    if name not in _LUT_BUILDERS:
+        raise ValueError(f"Phép biến đổi điểm không hỗ trợ: {name}")
+    lut = _LUT_BUILDERS[name](*params).astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+# =========================================
+# 2. Áp dụng LUT
+# =========================================
+@traced()
+def apply_lut(arr, lut, out=None):
+    """Tra bảng một lượt cho mảng uint8 bất kỳ số kênh (cv2.LUT, hoặc np.take khi không dùng được).
+    `out`: mảng kết quả cấp phát sẵn (có thể là chính `arr` để tra tại chỗ)."""
+    if arr.dtype != np.uint8:
+        raise ValueError("apply_lut chỉ hỗ trợ ảnh uint8")
+    if arr.ndim == 2 or arr.shape[-1] <= 4:
+        if out is None:
+            return cv2.LUT(arr, lut)
+        if out.flags.c_contiguous:
+            return cv2.LUT(arr, lut, dst=out)
+    return np.take(lut, arr, out=out)
+
+# =========================================
+# 3. Chuỗi biến đổi điểm gộp thành một LUT
+# =========================================
+@lru_cache(maxsize=LUT_CACHE_SIZE)
+def compose_lut(steps):
+    """Gộp chuỗi bước ((name, params), ...) thành một LUT: lut = lut_N[...lut_2[lut_1]]."""
+    lut = np.arange(256, dtype=np.uint8)
+    for name, params in steps:
+        lut = build_lut(name, *params)[lut]
+    lut.setflags(write=False)
+    return lut
+
+class PointOpChain:
+    """Chuỗi các phép biến đổi điểm theo từng kênh (negative, log, gamma, piecewise, threshold).
+    Bất biến: then() trả về chuỗi mới, nên có thể lưu từng trạng thái để hoàn tác."""
+
+    def __init__(self, steps=()):
+        self.steps = tuple(steps)
+
+    def then(self, name, *params):
+        return PointOpChain(self.steps + ((name, tuple(float(p) for p in params)),))
+
+    def lut(self):
+        return compose_lut(self.steps)
+
+    def apply(self, arr, out=None):
+        """Áp dụng cả chuỗi trong một lượt đọc/ghi ảnh."""
+        return apply_lut(arr, self.lut(), out=out)
+
+    def __len__(self):
+        return len(self.steps)
@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+# Độ chính xác của các công đoạn miền tần số: lưới D, hàm truyền H, DFT thuận, nhân H, DFT ngược.
+# Mặc định float32 (ảnh vào là uint8 nên đủ chính xác, băng thông bộ nhớ bằng một nửa);
+# float64 chỉ dùng khi cần đối chiếu chính xác cao.
+PRECISIONS = ('float32', 'float64')
+DEFAULT_PRECISION = 'float32'
+_precision = DEFAULT_PRECISION
+
+# =========================================
+# 1. Chính sách độ chính xác toàn cục
+# =========================================
+def set_precision(name):
+    global _precision
+    if name not in PRECISIONS:
+        raise ValueError(f"Độ chính xác không hỗ trợ: {name}")
+    _precision = name
+
+def get_precision():
+    return _precision
+
+@contextmanager
+def using_precision(name):
+    """Tạm đổi độ chính xác toàn cục trong khối with (ví dụ chạy một phép đối chiếu float64)."""
+    old = _precision
+    set_precision(name)
+    try:
+        yield
+    finally:
+        set_precision(old)
+
+def resolve(precision=None):
+    """Tên độ chính xác: tham số truyền vào (tên hoặc dtype) hoặc chính sách toàn cục."""
+    if precision is None:
+        return _precision
+    name = np.dtype(precision).name
+    if name not in PRECISIONS:
+        raise ValueError(f"Độ chính xác không hỗ trợ: {precision}")
+    return name
+
+def real_dtype(precision=None):
+    return np.dtype(resolve(precision))
+
+def complex_dtype(precision=None):
+    """complex64 cho float32, complex128 cho float64 (phổ nửa mặt phẳng của rfft2)."""
+    return np.result_type(real_dtype(precision), np.complex64)
+
+# =========================================
+# 2. Bộ nhớ làm việc đỉnh của một lần gọi
+# =========================================
+def record_peak(stats, *arrays):
+    """Ghi stats['peak_bytes'] = max(giá trị cũ, tổng byte các mảng khác nhau đang dùng cùng lúc).
+    Gọi ở mỗi công đoạn với các mảng còn sống tại đó; bỏ qua nếu stats là None."""
+    if stats is None:
+        return
+    nbytes = sum({id(a): a.nbytes for a in arrays if a is not None}.values())
+    stats['peak_bytes'] = max(stats.get('peak_bytes', 0), nbytes)
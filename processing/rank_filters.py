@@ -0,0 +1,124 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+from processing.buffer_arena import get_buffer
+from processing.tracing import traced
+
+# =========================================
+# 1. Min/Max trượt (van Herk / Gil-Werman)
+# =========================================
+def _running_extreme(P, n, op, out=None, scratch=None):
+    """Min/Max trượt cửa sổ n dọc theo trục 0 của mảng đã đệm (độ dài L).
+    Trả về mảng có L - n + 1 hàng; khoảng 3 phép so sánh mỗi phần tử, không phụ thuộc n."""
+    L = P.shape[0]
+    out_len = L - n + 1
+    nb = -(-L // n)
+
+    # Đệm bằng phần tử trung hòa để khối cuối đủ n phần tử
+    info = np.iinfo(P.dtype) if np.issubdtype(P.dtype, np.integer) else np.finfo(P.dtype)
+    fill = info.max if op is np.minimum else info.min
+    X = get_buffer(scratch, 'rank_x', (nb * n,) + P.shape[1:], P.dtype)
+    X[:L] = P
+    X[L:] = fill
+    Xb = X.reshape((nb, n) + P.shape[1:])
+
+    # g: tích lũy từ đầu mỗi khối, h: tích lũy từ cuối mỗi khối.
+    # Lặp theo vị trí trong khối, mỗi bước là một phép toán trên toàn bộ các khối.
+    g = get_buffer(scratch, 'rank_g', Xb.shape, P.dtype)
+    h = get_buffer(scratch, 'rank_h', Xb.shape, P.dtype)
+    g[:, 0] = Xb[:, 0]
+    h[:, n - 1] = Xb[:, n - 1]
+    for i in range(1, n):
+        op(g[:, i - 1], Xb[:, i], out=g[:, i])
+        op(h[:, n - i], Xb[:, n - 1 - i], out=h[:, n - 1 - i])
+    g = g.reshape(X.shape)
+    h = h.reshape(X.shape)
+    if out is None:
+        out = np.empty((out_len,) + P.shape[1:], dtype=P.dtype)
+    return op(h[:out_len], g[n - 1:n - 1 + out_len], out=out)
+
+def _transpose(A, out=None):
+    """Hoán đổi trục 0 và 1 thành mảng liên tục (cv2.transpose nhanh hơn nhiều với ảnh màu)."""
+    if A.dtype in (np.uint8, np.float32) and (A.ndim == 2 or (A.ndim == 3 and A.shape[2] in (3, 4))):
+        return cv2.transpose(A, dst=out)
+    if out is None:
+        return np.ascontiguousarray(np.swapaxes(A, 0, 1))
+    out[...] = np.swapaxes(A, 0, 1)
+    return out
+
+def _separable_extreme(P, n, op, out=None, scratch=None):
+    """Lọc 2D = lọc theo hàng rồi theo cột (chuyển vị để luôn chạy trên trục 0)."""
+    L0, L1 = P.shape[0] - n + 1, P.shape[1] - n + 1
+    rest = P.shape[2:]
+    R = _running_extreme(P, n, op, get_buffer(scratch, 'rank_r1', (L0, P.shape[1]) + rest, P.dtype), scratch)
+    T = _transpose(R, get_buffer(scratch, 'rank_t1', (P.shape[1], L0) + rest, P.dtype))
+    R = _running_extreme(T, n, op, get_buffer(scratch, 'rank_r2', (L1, L0) + rest, P.dtype), scratch)
+    return _transpose(R, out)
+
+def _pad_edge(arr, n, scratch=None):
+    r = n // 2
+    if scratch is None:
+        pad = [(r, n - 1 - r), (r, n - 1 - r)] + [(0, 0)] * (arr.ndim - 2)
+        return np.pad(arr, pad, mode='edge')
+    # Đệm lặp biên vào bộ đệm dùng lại (cùng kết quả với np.pad mode='edge')
+    h, w = arr.shape[:2]
+    P = scratch.get('rank_pad', (h + n - 1, w + n - 1) + arr.shape[2:], arr.dtype)
+    P[r:r + h, r:r + w] = arr
+    P[:r, r:r + w] = arr[:1]
+    P[r + h:, r:r + w] = arr[-1:]
+    P[:, :r] = P[:, r:r + 1]
+    P[:, r + w:] = P[:, r + w - 1:r + w]
+    return P
+
+@traced()
+def rank_extreme_filter(arr, n, filter_type='min', out=None, scratch=None):
+    """Lọc Min/Max n x n trên mảng HxW hoặc HxWxC (biên lặp lại như PIL).
+    `out`: mảng kết quả cấp phát sẵn; `scratch`: BufferArena cho các mảng tạm."""
+    op = np.minimum if filter_type == 'min' else np.maximum
+    return _separable_extreme(_pad_edge(arr, n, scratch), n, op, out, scratch)
+
+@traced()
+def min_max_filter(arr, n, out=None, scratch=None):
+    """Trả về (ảnh Min, ảnh Max) n x n, dùng chung một bản đệm. `out` là cặp (min, max)."""
+    out_min, out_max = out if out is not None else (None, None)
+    P = _pad_edge(arr, n, scratch)
+    return (_separable_extreme(P, n, np.minimum, out_min, scratch),
+            _separable_extreme(P, n, np.maximum, out_max, scratch))
+
+# =========================================
+# 2. Trung vị bằng histogram trượt (uint8)
+# =========================================
+# Số luồng mặc định cho lọc trung vị theo dải cột (cv2 nhả GIL khi tính)
+MEDIAN_WORKERS = os.cpu_count() or 1
+
+@traced()
+def median_filter_hist(arr, n, workers=None, strip_width=256, out=None, scratch=None):
+    """Lọc trung vị n x n cho mảng uint8 HxW hoặc HxWxC (biên lặp lại như PIL).
+    Mỗi dải cột (kèm vùng chồng n // 2) được lọc bằng cv2.medianBlur, với n > 5 là
+    thuật toán histogram trượt Perreault-Hébert: chi phí mỗi pixel không phụ thuộc n.
+    Các dải chạy song song trên thread pool. `out`/`scratch` như rank_extreme_filter."""
+    if arr.dtype != np.uint8:
+        raise ValueError("median_filter_hist chỉ hỗ trợ ảnh uint8")
+    workers = workers or MEDIAN_WORKERS
+    h, w = arr.shape[:2]
+    r = n // 2
+    P = _pad_edge(arr, n, scratch)
+    if out is None:
+        out = np.empty_like(arr)
+
+    strips = [(c0, min(w, c0 + strip_width)) for c0 in range(0, w, strip_width)]
+    def run(strip):
+        c0, c1 = strip
+        block = np.ascontiguousarray(P[:, c0:c1 + n - 1])
+        out[:, c0:c1] = cv2.medianBlur(block, n)[r:r + h, r:r + c1 - c0]
+
+    if workers <= 1 or len(strips) == 1:
+        for s in strips:
+            run(s)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, strips))
+    return out
@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import numpy as np
+
+from processing.image_buffer import ImageBuffer, unwrap, wrap_like
+from processing.tracing import span, traced
+
+# Cấu hình mặc định cho bộ chia ô (có thể ghi đè khi gọi)
+TILE_SIZE = 512
+TILE_WORKERS = os.cpu_count() or 1
+
+# =========================================
+# 1. Chia ô có vùng chồng (halo)
+# =========================================
+def split_tiles(h, w, tile_size):
+    """Danh sách ô (y0, y1, x0, x1) phủ kín ảnh h x w, không chồng nhau."""
+    return [(y0, min(h, y0 + tile_size), x0, min(w, x0 + tile_size))
+            for y0 in range(0, h, tile_size)
+            for x0 in range(0, w, tile_size)]
+
+@traced()
+def run_tiled_array(func, arr, halo, tile_size=None, workers=None, out=None, scratch=None):
+    """Chạy func trên từng ô (mở rộng thêm `halo` pixel mỗi phía, cắt theo biên ảnh)
+    bằng thread pool rồi ghép lại. func nhận mảng vùng và trả về mảng cùng kích thước HxW.
+    Với bộ lọc cục bộ bán kính <= halo, kết quả trùng khớp từng bit với func(arr).
+    Nếu có `scratch` (BufferArena), mỗi ô mượn một arena con và gọi func(vùng, scratch=con)."""
+    tile_size = tile_size or TILE_SIZE
+    workers = workers or TILE_WORKERS
+    h, w = arr.shape[:2]
+    tiles = split_tiles(h, w, tile_size)
+
+    def run(tile, dst=None):
+        with span('tiling.tile', 'tile', y0=tile[0], x0=tile[2]):
+            return run_tile(tile, dst)
+
+    def run_tile(tile, dst=None):
+        y0, y1, x0, x1 = tile
+        ry0, rx0 = max(0, y0 - halo), max(0, x0 - halo)
+        ry1, rx1 = min(h, y1 + halo), min(w, x1 + halo)
+        crop = (slice(y0 - ry0, y1 - ry0), slice(x0 - rx0, x1 - rx0))
+        if scratch is None:
+            res = func(arr[ry0:ry1, rx0:rx1])[crop]
+        else:
+            # Kết quả nằm trong arena con nên phải chép ra trước khi trả arena lại
+            with scratch.borrow() as child:
+                res = func(arr[ry0:ry1, rx0:rx1], scratch=child)[crop]
+                if dst is not None:
+                    dst[y0:y1, x0:x1] = res
+                    return
+                res = res.copy()
+        if dst is not None:
+            dst[y0:y1, x0:x1] = res
+        return res
+
+    rest = tiles
+    if out is None:
+        # Ô đầu tiên chạy trước để biết dtype / số kênh của kết quả
+        first = run(tiles[0])
+        out = np.empty((h, w) + first.shape[2:], dtype=first.dtype)
+        y0, y1, x0, x1 = tiles[0]
+        out[y0:y1, x0:x1] = first
+        rest = tiles[1:]
+
+    def run_and_store(tile):
+        run(tile, out)
+
+    if workers <= 1 or len(rest) <= 1:
+        for tile in rest:
+            run_and_store(tile)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run_and_store, rest))
+    return out
+
+# =========================================
+# 2. Bọc bộ lọc PIL (image, k) -> image
+# =========================================
+def tiled(func, halo=lambda k: k // 2, tile_size=None, workers=None):
+    """Trả về hàm cùng chữ ký func(image, k, ..., out=None, scratch=None) nhưng chạy song song
+    theo ô. `halo(k)` là bán kính ảnh hưởng của bộ lọc với kernel k. Khi có `scratch`, func
+    phải nhận out=/scratch= và trả về ảnh cùng mode với đầu vào (kết quả mỗi ô ghi vào arena con)."""
+    @wraps(func)
+    def wrapper(image, k, *args, out=None, scratch=None, **kwargs):
+        arr, mode = unwrap(image)
+        order = 'GRAY' if mode == 'L' else 'RGB'
+        result_mode = []
+
+        def run_region(region, scratch=None):
+            # Ô được bọc thành ImageBuffer (không sao chép sang PIL)
+            if scratch is None:
+                res = func(ImageBuffer(region, order), k, *args, **kwargs)
+            else:
+                # Chép ô vào bộ đệm liên tục của arena con thay vì cấp phát bản sao mới
+                src = scratch.get('tile_in', region.shape)
+                src[...] = region
+                res = func(ImageBuffer(src, order), k, *args,
+                           out=scratch.get('tile_out', region.shape), scratch=scratch, **kwargs)
+            res_arr, res_mode = unwrap(res)
+            result_mode.append(res_mode)
+            return res_arr
+
+        out = run_tiled_array(run_region, arr, halo(k), tile_size, workers, out=out, scratch=scratch)
+        return wrap_like(image, out, result_mode[0] if result_mode else mode)
+    return wrapper
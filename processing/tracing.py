@@ -0,0 +1,139 @@
+import csv
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+# Bật sẵn khi chạy với biến môi trường IMG_TRACE=1 (hoặc gọi enable() lúc chạy)
+_enabled = os.environ.get('IMG_TRACE') == '1'
+_events = []            # (tên, nhóm, tid, độ sâu, bắt đầu ns, thời lượng ns, args)
+_thread_names = {}
+_local = threading.local()
+_epoch_ns = time.perf_counter_ns()
+
+# =========================================
+# 1. Bật / tắt
+# =========================================
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def clear():
+    """Xoá các span đã ghi; mốc thời gian 0 của trace đặt lại về lúc này."""
+    global _epoch_ns
+    _events.clear()
+    _thread_names.clear()
+    _epoch_ns = time.perf_counter_ns()
+
+# =========================================
+# 2. Span (context manager) và decorator
+# =========================================
+class Span:
+    """Đo một đoạn mã: luôn có elapsed_ms sau khi thoát (dùng cho các hộp thoại thời gian),
+    chỉ ghi vào trace khi tracing đang bật. Nếu có `timings` thì ghi thêm timings[key] = ms.
+    Span lồng nhau trong cùng một luồng được ghi kèm độ sâu."""
+    __slots__ = ('name', 'cat', 'args', 'start_ns', 'elapsed_ms', '_timings', '_key', '_recording')
+
+    def __init__(self, name, cat='app', args=None, timings=None, key=None):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.elapsed_ms = 0.0
+        self._timings = timings
+        self._key = key
+
+    def __enter__(self):
+        self._recording = _enabled
+        if self._recording:
+            _local.depth = getattr(_local, 'depth', 0) + 1
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        dur = time.perf_counter_ns() - self.start_ns
+        self.elapsed_ms = dur / 1e6
+        if self._timings is not None:
+            self._timings[self._key] = self.elapsed_ms
+        if self._recording:
+            depth = _local.depth - 1
+            _local.depth = depth
+            tid = threading.get_ident()
+            if tid not in _thread_names:
+                _thread_names[tid] = threading.current_thread().name
+            _events.append((self.name, self.cat, tid, depth, self.start_ns, dur, self.args))
+        return False
+
+def span(name, cat='app', **args):
+    """with span('ten', tham_so=...) as sp: ...  ->  sp.elapsed_ms"""
+    return Span(name, cat, args or None)
+
+def stage(timings, key, name, cat='stage'):
+    """Span ghi thêm thời gian (ms) vào dict `timings` dưới khoá `key` (các hộp thoại thời gian cũ)."""
+    return Span(name, cat, None, timings, key)
+
+def traced(name=None, cat='processing'):
+    """Decorator: mỗi lần gọi hàm là một span (tên mặc định 'module.hàm').
+    Khi tracing tắt chỉ tốn một phép kiểm tra cờ."""
+    def decorator(func):
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(label, cat):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# =========================================
+# 3. Xuất kết quả
+# =========================================
+def get_events():
+    """Danh sách span đã ghi (dict), theo thứ tự kết thúc."""
+    return [{'name': name, 'cat': cat, 'tid': tid, 'thread': _thread_names.get(tid, str(tid)),
+             'depth': depth, 'start_ms': (start - _epoch_ns) / 1e6, 'duration_ms': dur / 1e6,
+             'args': args or {}}
+            for name, cat, tid, depth, start, dur, args in list(_events)]
+
+def summary():
+    """Tổng hợp theo tên span: {tên: {'count', 'total_ms', 'mean_ms', 'max_ms'}}, giảm dần theo tổng."""
+    stats = {}
+    for ev in get_events():
+        s = stats.setdefault(ev['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        s['count'] += 1
+        s['total_ms'] += ev['duration_ms']
+        s['max_ms'] = max(s['max_ms'], ev['duration_ms'])
+    for s in stats.values():
+        s['mean_ms'] = s['total_ms'] / s['count']
+    return dict(sorted(stats.items(), key=lambda kv: -kv[1]['total_ms']))
+
+def export_chrome_trace(path):
+    """Ghi file JSON định dạng Chrome trace (mở bằng chrome://tracing hoặc ui.perfetto.dev)."""
+    pid = os.getpid()
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': tname}}
+              for tid, tname in list(_thread_names.items())]
+    for ev in get_events():
+        events.append({'name': ev['name'], 'cat': ev['cat'], 'ph': 'X', 'pid': pid, 'tid': ev['tid'],
+                       'ts': ev['start_ms'] * 1000, 'dur': ev['duration_ms'] * 1000,
+                       'args': {k: str(v) for k, v in ev['args'].items()}})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def export_csv(path):
+    """Ghi bảng phẳng: mỗi span một dòng, sắp theo thời điểm bắt đầu."""
+    fields = ['name', 'cat', 'thread', 'depth', 'start_ms', 'duration_ms', 'args']
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for ev in sorted(get_events(), key=lambda e: e['start_ms']):
+            ev['args'] = json.dumps(ev['args'], default=str, ensure_ascii=False) if ev['args'] else ''
+            writer.writerow(ev)